@@ -1,13 +1,16 @@
 """API endpoints for fare calculation."""
 
 from fastapi import APIRouter, HTTPException, Depends, Body
-from typing import List, Optional
+from fastapi.responses import ORJSONResponse
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session
 
-from app.models import JourneyRequest, FareResponse
+from app.models import JourneyRequest, FareResponse, FareRulesResponse
 from app.services import get_fare_calculator
 from app.services.fare_calculator import FareCalculatorInterface
 from app.config import settings
-from app.database import get_db_manager
+from app.database import DatabaseManager, get_db_manager, get_db
+from app.cache import invalidate_fare_rules
 
 router = APIRouter(prefix="/api", tags=["Fare Calculation"])
 
@@ -21,22 +24,26 @@ def get_calculator() -> FareCalculatorInterface:
 
 
 @router.post("/calculate-fares", response_model=FareResponse)
-async def calculate_fares(
+def calculate_fares(
     request: JourneyRequest,
     calculator: FareCalculatorInterface = Depends(get_calculator)
-) -> FareResponse:
+) -> ORJSONResponse:
     """
     Calculate fares for a list of journeys.
     
     Note: calculator is injected as FareCalculatorInterface,
     allowing any implementation to be used (Dependency Inversion Principle).
     
+    Declared as a plain def so a cold fare snapshot load (blocking database
+    I/O) runs in FastAPI's threadpool and the event loop stays free.
+    
     Args:
         request: Journey request containing list of journeys
         calculator: Injected fare calculator implementing FareCalculatorInterface
         
     Returns:
-        FareResponse with calculated fares and total
+        FareResponse-shaped dict with calculated fares and total, encoded
+        with orjson (response_model only documents the schema)
         
     Raises:
         HTTPException: If validation fails
@@ -49,9 +56,9 @@ async def calculate_fares(
                 detail=f"Maximum {settings.MAX_JOURNEYS_PER_DAY} journeys allowed per day"
             )
         
-        # Calculate fares
+        # Calculate fares (one gather over the in-process fare matrix)
         response = calculator.calculate_all_fares(request.journeys)
-        return response
+        return ORJSONResponse(response)
         
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -59,33 +66,35 @@ async def calculate_fares(
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
 
-@router.get("/fare-rules")
-async def get_fare_rules():
+@router.get("/fare-rules", response_model=FareRulesResponse)
+async def get_fare_rules(
+    db_manager: DatabaseManager = Depends(get_db_manager),
+    db: Session = Depends(get_db)
+) -> ORJSONResponse:
     """
     Get all fare rules from the local datastore.
     
     Returns:
-        Dictionary of fare rules from database
+        FareRulesResponse-shaped dict of fare rules from database, encoded
+        with orjson (response_model only documents the schema)
     """
-    db_manager = get_db_manager()
-    rules_dict = db_manager.get_all_fare_rules()
+    # Rules and available zones come from a single scan of the table
+    rules_dict, available_zones = db_manager.get_rules_and_zones(session=db)
     
-    rules = []
-    for (from_zone, to_zone), fare in rules_dict.items():
-        rules.append({
+    rules = [
+        {
             "from_zone": from_zone,
             "to_zone": to_zone,
             "fare": fare,
             "description": f"Zone {from_zone} to Zone {to_zone}"
-        })
+        }
+        for (from_zone, to_zone), fare in rules_dict.items()
+    ]
     
     # Get max journeys from database config
-    max_journeys = db_manager.get_config_value("max_journeys_per_day")
-    
-    # Get available zones dynamically from database
-    available_zones = db_manager.get_available_zones()
+    max_journeys = db_manager.get_config_value("max_journeys_per_day", session=db)
     
-    return {
+    return ORJSONResponse({
         "rules": rules,
         "max_journeys_per_day": int(max_journeys) if max_journeys else settings.MAX_JOURNEYS_PER_DAY,
         "available_zones": available_zones,
@@ -93,14 +102,16 @@ async def get_fare_rules():
         "max_zone": max(available_zones) if available_zones else None,
         "total_zones": len(available_zones),
         "datastore": "SQLite Local Database"
-    }
+    })
 
 
 @router.put("/fare-rules")
 async def update_fare_rule(
     from_zone: int = Body(..., ge=1),
     to_zone: int = Body(..., ge=1),
-    fare: float = Body(..., gt=0)
+    fare: float = Body(..., gt=0),
+    db_manager: DatabaseManager = Depends(get_db_manager),
+    db: Session = Depends(get_db)
 ):
     """
     Update a fare rule in the local datastore.
@@ -121,11 +132,11 @@ async def update_fare_rule(
             detail=f"Invalid zone numbers. Available zones: {available_zones}"
         )
     
-    db_manager = get_db_manager()
-    rule = db_manager.update_fare_rule(from_zone, to_zone, fare)
+    rule = db_manager.update_fare_rule(from_zone, to_zone, fare, session=db)
     
-    # Clear cache to ensure new rules are loaded
+    # Clear caches here and in other worker processes
     settings.reload_fare_rules()
+    invalidate_fare_rules()
     
     return {
         "from_zone": rule.from_zone,
@@ -137,8 +148,10 @@ async def update_fare_rule(
 
 @router.post("/zones")
 async def add_new_zone(
-    zone_number: int = Body(..., ge=1),
-    fares_to_existing_zones: dict = Body(...)
+    zone_number: int = Body(..., ge=1, le=settings.MAX_ZONE_NUMBER),
+    fares_to_existing_zones: Dict[int, float] = Body(...),
+    db_manager: DatabaseManager = Depends(get_db_manager),
+    db: Session = Depends(get_db)
 ):
     """
     Add a new zone with fare rules to all existing zones.
@@ -151,17 +164,24 @@ async def add_new_zone(
     Returns:
         Success message with new zone details
     """
-    db_manager = get_db_manager()
-    
     # Check if zone already exists
-    if db_manager.is_valid_zone(zone_number):
+    if db_manager.is_valid_zone(zone_number, session=db):
         raise HTTPException(
             status_code=400,
             detail=f"Zone {zone_number} already exists"
         )
     
     # Validate all existing zones are covered
-    existing_zones = db_manager.get_available_zones()
+    existing_zones = db_manager.get_available_zones(session=db)
+    
+    # Fares may only link the new zone to zones that exist, so a stray key
+    # can't create an extra zone
+    unknown_zones = set(fares_to_existing_zones) - set(existing_zones) - {zone_number}
+    if unknown_zones:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown zones in fares: {sorted(unknown_zones)}"
+        )
     
     # Add self-fare (same zone travel)
     if zone_number not in fares_to_existing_zones:
@@ -171,22 +191,25 @@ async def add_new_zone(
         )
     
     # Add the new zone
-    db_manager.add_zone(zone_number, fares_to_existing_zones)
+    db_manager.add_zone(zone_number, fares_to_existing_zones, session=db)
     
-    # Clear cache
+    # Clear caches here and in other worker processes
     settings.reload_fare_rules()
+    invalidate_fare_rules()
     
     return {
         "message": f"Zone {zone_number} added successfully",
         "new_zone": zone_number,
         "fare_rules_added": len(fares_to_existing_zones),
-        "total_zones": len(db_manager.get_available_zones())
+        "total_zones": len(db_manager.get_available_zones(session=db))
     }
 
 
 @router.get("/health")
 async def health_check():
     """Health check endpoint including database status."""
+    # Resolved in-body rather than via Depends so a datastore failure is
+    # reported as unhealthy instead of failing the request
     db_status = "healthy"
     try:
         db_manager = get_db_manager()
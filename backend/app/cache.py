@@ -3,11 +3,20 @@ Caching layer for fare rules to handle millions of users.
 Uses Redis for distributed caching with fallback to in-memory cache.
 """
 
-import json
+import logging
+import os
+import struct
+import threading
 import time
-from typing import Dict, Tuple, Optional, Any
-from functools import lru_cache
-import hashlib
+from collections import OrderedDict
+from typing import Callable, Dict, List, Tuple, Optional
+
+import numpy as np
+import xxhash
+
+from app.database import get_db_manager
+
+logger = logging.getLogger(__name__)
 
 # Note: Add to requirements.txt if using Redis:
 # redis==5.0.1
@@ -17,7 +26,21 @@ try:
     REDIS_AVAILABLE = True
 except ImportError:
     REDIS_AVAILABLE = False
-    print("Redis not installed. Using in-memory cache only.")
+    logger.info("Redis not installed. Using in-memory cache only.")
+
+# Fares are stored in Redis as 8-byte big-endian doubles under fixed-width
+# keys: b"f" followed by the two zone numbers as unsigned 32-bit ints
+_FARE_STRUCT = struct.Struct("!d")
+_KEY_STRUCT = struct.Struct("<II")
+_KEY_PREFIX = b"f"
+_KEY_PATTERN = _KEY_PREFIX + b"?" * _KEY_STRUCT.size
+
+# (from_zone, to_zone, fare) record used to fingerprint the rules
+_RULE_STRUCT = struct.Struct("<iid")
+
+# Most zones the dense fare matrix is built for (512 KB of float64 plus the
+# row lists); beyond this, fares are looked up in the rules dict instead
+MAX_MATRIX_ZONES = 256
 
 
 class FareRulesCache:
@@ -28,44 +51,67 @@ class FareRulesCache:
     3. Database (source of truth)
     """
     
-    def __init__(self, redis_url: Optional[str] = None, ttl: int = 3600):
+    def __init__(self, redis_url: Optional[str] = None, ttl: int = 3600,
+                 max_entries: int = 10_000):
         """
         Initialize cache with optional Redis connection.
         
         Args:
             redis_url: Redis connection URL (e.g., redis://localhost:6379)
-            ttl: Time to live in seconds (default 1 hour)
+            ttl: Time to live in seconds for Redis entries (default 1 hour)
+            max_entries: Hard cap on zone pairs held in memory (default 10,000)
         """
         self.ttl = ttl
+        self.max_entries = max_entries
         self.redis_client = None
         
-        # In-memory cache for this process
-        self._memory_cache: Dict[str, Any] = {}
-        self._cache_timestamps: Dict[str, float] = {}
+        # In-memory LRU for this process, keyed by sorted zone pair and
+        # bounded by max_entries so zone growth can't leak memory.
+        # Entries are invalidated explicitly rather than by TTL.
+        self._lru: "OrderedDict[Tuple[int, int], float]" = OrderedDict()
+        self._lru_lock = threading.Lock()
         
         # Initialize Redis if available
         if REDIS_AVAILABLE and redis_url:
             try:
-                self.redis_client = redis.from_url(redis_url)
+                pool = redis.ConnectionPool.from_url(
+                    redis_url,
+                    max_connections=64,
+                    decode_responses=False
+                )
+                self.redis_client = redis.Redis(connection_pool=pool)
                 self.redis_client.ping()
-                print("Redis cache initialized successfully")
+                logger.info("Redis cache initialized successfully")
             except Exception as e:
-                print(f"Redis connection failed: {e}. Using in-memory cache only.")
+                logger.warning("Redis connection failed: %s. Using in-memory cache only.", e)
                 self.redis_client = None
     
-    def _make_key(self, from_zone: int, to_zone: int) -> str:
-        """Generate cache key for zone pair."""
+    def _make_redis_key(self, from_zone: int, to_zone: int) -> bytes:
+        """Generate fixed-width 9-byte Redis key for zone pair."""
         # Normalize zones (always use lower zone first)
-        z1, z2 = sorted([from_zone, to_zone])
-        return f"fare:{z1}:{z2}"
+        z1, z2 = (from_zone, to_zone) if from_zone <= to_zone else (to_zone, from_zone)
+        return _KEY_PREFIX + _KEY_STRUCT.pack(z1, z2)
     
-    def _is_memory_cache_valid(self, key: str) -> bool:
-        """Check if in-memory cache entry is still valid."""
-        if key not in self._cache_timestamps:
-            return False
-        return (time.time() - self._cache_timestamps[key]) < self.ttl
+    def _make_mem_key(self, from_zone: int, to_zone: int) -> Tuple[int, int]:
+        """Generate in-memory cache key for zone pair."""
+        return (from_zone, to_zone) if from_zone <= to_zone else (to_zone, from_zone)
+    
+    def _remember(self, mem_key: Tuple[int, int], fare: float):
+        """Store a fare in the in-memory LRU, evicting the oldest if full."""
+        with self._lru_lock:
+            self._lru[mem_key] = fare
+            self._lru.move_to_end(mem_key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+    
+    def _recall(self, mem_key: Tuple[int, int]) -> Optional[float]:
+        """Get a fare from the in-memory LRU, marking it recently used."""
+        with self._lru_lock:
+            fare = self._lru.get(mem_key)
+            if fare is not None:
+                self._lru.move_to_end(mem_key)
+            return fare
     
-    @lru_cache(maxsize=1000)
     def get_fare_cached(self, from_zone: int, to_zone: int) -> Optional[float]:
         """
         Get fare with multi-level caching.
@@ -75,42 +121,41 @@ class FareRulesCache:
         2. Redis cache
         3. Database (if cache miss)
         """
-        key = self._make_key(from_zone, to_zone)
+        mem_key = self._make_mem_key(from_zone, to_zone)
         
         # Level 1: Check in-memory cache
-        if key in self._memory_cache and self._is_memory_cache_valid(key):
-            return self._memory_cache[key]
+        fare = self._recall(mem_key)
+        if fare is not None:
+            return fare
         
         # Level 2: Check Redis cache
         if self.redis_client:
             try:
-                cached_value = self.redis_client.get(key)
+                cached_value = self.redis_client.get(self._make_redis_key(from_zone, to_zone))
                 if cached_value:
-                    fare = float(cached_value)
+                    fare = _FARE_STRUCT.unpack(cached_value)[0]
                     # Update in-memory cache
-                    self._memory_cache[key] = fare
-                    self._cache_timestamps[key] = time.time()
+                    self._remember(mem_key, fare)
                     return fare
             except Exception as e:
-                print(f"Redis get error: {e}")
+                logger.debug("Redis get error: %s", e)
         
-        # Cache miss - will need to fetch from database
+        # Cache miss - will need to fetch from database (misses are not cached)
         return None
     
     def set_fare_cache(self, from_zone: int, to_zone: int, fare: float):
         """Store fare in all cache levels."""
-        key = self._make_key(from_zone, to_zone)
+        key = self._make_redis_key(from_zone, to_zone)
         
         # Update in-memory cache
-        self._memory_cache[key] = fare
-        self._cache_timestamps[key] = time.time()
+        self._remember(self._make_mem_key(from_zone, to_zone), fare)
         
         # Update Redis cache
         if self.redis_client:
             try:
-                self.redis_client.setex(key, self.ttl, str(fare))
+                self.redis_client.set(key, _FARE_STRUCT.pack(fare), ex=self.ttl)
             except Exception as e:
-                print(f"Redis set error: {e}")
+                logger.debug("Redis set error: %s", e)
     
     def invalidate_cache(self, from_zone: Optional[int] = None, to_zone: Optional[int] = None):
         """
@@ -120,58 +165,107 @@ class FareRulesCache:
         """
         if from_zone and to_zone:
             # Invalidate specific entry
-            key = self._make_key(from_zone, to_zone)
+            key = self._make_redis_key(from_zone, to_zone)
             
             # Clear from memory
-            self._memory_cache.pop(key, None)
-            self._cache_timestamps.pop(key, None)
-            self.get_fare_cached.cache_clear()
+            with self._lru_lock:
+                self._lru.pop(self._make_mem_key(from_zone, to_zone), None)
             
             # Clear from Redis
             if self.redis_client:
                 try:
                     self.redis_client.delete(key)
                 except Exception as e:
-                    print(f"Redis delete error: {e}")
+                    logger.warning("Redis delete error: %s", e)
         else:
             # Clear all caches
-            self._memory_cache.clear()
-            self._cache_timestamps.clear()
-            self.get_fare_cached.cache_clear()
+            with self._lru_lock:
+                self._lru.clear()
             
             if self.redis_client:
                 try:
                     # Clear all fare keys
-                    for key in self.redis_client.scan_iter("fare:*"):
+                    for key in self.redis_client.scan_iter(_KEY_PATTERN):
                         self.redis_client.delete(key)
                 except Exception as e:
-                    print(f"Redis clear error: {e}")
+                    logger.warning("Redis clear error: %s", e)
+
+
+class FareRulesSnapshot:
+    """
+    Immutable in-process copy of the fare rules table.
+    
+    The rules table is tiny and changes rarely, so each process keeps the
+    whole thing in a plain dict and answers lookups without touching Redis
+    or the database. Snapshots are never mutated: a reload builds a new
+    snapshot and swaps the module-level reference.
+    """
     
-    def bulk_load_fares(self, fare_rules: Dict[Tuple[int, int], float]):
+    def __init__(self, fare_rules: Dict[Tuple[int, int], float]):
         """
-        Bulk load fare rules into cache.
-        Useful for warming up cache on startup.
+        Freeze fare rules into a lookup table.
+        
+        Args:
+            fare_rules: Dict mapping (from_zone, to_zone) to fare
         """
-        pipeline = self.redis_client.pipeline() if self.redis_client else None
+        # Fares are the same in both directions, so key on the sorted pair
+        self._rules: Dict[Tuple[int, int], float] = {
+            (min(a, b), max(a, b)): fare
+            for (a, b), fare in fare_rules.items()
+        }
+        self._zones: Tuple[int, ...] = tuple(
+            sorted({zone for pair in self._rules for zone in pair})
+        )
         
-        for (from_zone, to_zone), fare in fare_rules.items():
-            key = self._make_key(from_zone, to_zone)
-            
-            # Update memory cache
-            self._memory_cache[key] = fare
-            self._cache_timestamps[key] = time.time()
-            
-            # Add to Redis pipeline
-            if pipeline:
-                pipeline.setex(key, self.ttl, str(fare))
+        # Zones are numbered by operators and may be sparse, so the matrix
+        # is indexed by each zone's position in zones, not its number:
+        # memory grows with the number of zones, not the largest zone
+        self._zone_index: Dict[int, int] = {zone: i for i, zone in enumerate(self._zones)}
         
-        # Execute Redis pipeline
-        if pipeline:
-            try:
-                pipeline.execute()
-                print(f"Bulk loaded {len(fare_rules)} fare rules into cache")
-            except Exception as e:
-                print(f"Redis bulk load error: {e}")
+        # Dense symmetric matrix indexed by [zone_index[from_zone],
+        # zone_index[to_zone]] so a whole request can be priced with one
+        # vectorized gather (0.0 where no rule). Skipped above
+        # MAX_MATRIX_ZONES, where callers fall back to the rules dict.
+        self._fare_matrix: Optional[np.ndarray] = None
+        self._fare_rows: Optional[List[List[float]]] = None
+        size = len(self._zones)
+        if size <= MAX_MATRIX_ZONES:
+            index = self._zone_index
+            matrix = np.zeros((size, size), dtype=np.float64)
+            for (a, b), fare in self._rules.items():
+                i, j = index[a], index[b]
+                matrix[i, j] = matrix[j, i] = fare
+            matrix.setflags(write=False)
+            self._fare_matrix = matrix
+            
+            # The same matrix as nested lists of Python floats: single
+            # lookups are two list indexes, with no tuple key to build or hash
+            self._fare_rows = matrix.tolist()
+    
+    @property
+    def rules(self) -> Dict[Tuple[int, int], float]:
+        """Fare rules keyed by sorted (zone, zone) pair."""
+        return self._rules
+    
+    @property
+    def zones(self) -> Tuple[int, ...]:
+        """Sorted zones covered by the fare rules."""
+        return self._zones
+    
+    @property
+    def zone_index(self) -> Dict[int, int]:
+        """Position of each zone in zones, used to index the fare matrix."""
+        return self._zone_index
+    
+    @property
+    def fare_rows(self) -> Optional[List[List[float]]]:
+        """Fares indexed by zone position [from][to] (0.0 where no rule); None above MAX_MATRIX_ZONES."""
+        return self._fare_rows
+    
+    @property
+    def fare_matrix(self) -> Optional[np.ndarray]:
+        """Read-only float64 fares indexed by zone position [from, to] (0.0 where no rule); None above MAX_MATRIX_ZONES."""
+        return self._fare_matrix
 
 
 class ZonesCache:
@@ -181,7 +275,7 @@ class ZonesCache:
         self.ttl = ttl
         self._zones: Optional[list] = None
         self._zones_timestamp: float = 0
-        self._rules_hash: Optional[str] = None
+        self._rules_hash: Optional[int] = None
     
     def is_valid(self) -> bool:
         """Check if zones cache is still valid."""
@@ -199,9 +293,13 @@ class ZonesCache:
         """Update zones cache with hash for validation."""
         self._zones = zones
         self._zones_timestamp = time.time()
-        # Create hash of rules to detect changes
-        rules_str = json.dumps(sorted(rules_dict.items()))
-        self._rules_hash = hashlib.md5(rules_str.encode()).hexdigest()
+        # Fingerprint the rules to detect changes: XOR the XXH3 hash of each
+        # packed (from_zone, to_zone, fare) record. XOR is order-independent,
+        # so rows can be fed in any order without sorting.
+        rules_hash = 0
+        for (from_zone, to_zone), fare in rules_dict.items():
+            rules_hash ^= xxhash.xxh3_64_intdigest(_RULE_STRUCT.pack(from_zone, to_zone, fare))
+        self._rules_hash = rules_hash
     
     def invalidate(self):
         """Invalidate zones cache."""
@@ -210,9 +308,15 @@ class ZonesCache:
         self._rules_hash = None
 
 
+# Redis channel used to tell other processes to reload their snapshot
+INVALIDATION_CHANNEL = "fare_rules:invalidate"
+
 # Global cache instances (singleton pattern)
 _fare_cache: Optional[FareRulesCache] = None
 _zones_cache: Optional[ZonesCache] = None
+_snapshot: Optional[FareRulesSnapshot] = None
+_snapshot_lock = threading.Lock()
+_reload_hooks: List[Callable[[], None]] = []
 
 
 def get_fare_cache() -> FareRulesCache:
@@ -220,16 +324,9 @@ def get_fare_cache() -> FareRulesCache:
     global _fare_cache
     if _fare_cache is None:
         redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        # Fares are served from the snapshot, so nothing is preloaded into
+        # Redis; the client is kept for snapshot invalidation messages
         _fare_cache = FareRulesCache(redis_url=redis_url)
-        
-        # Warm up cache on first access
-        try:
-            from app.database import get_db_manager
-            db_manager = get_db_manager()
-            fare_rules = db_manager.get_all_fare_rules()
-            _fare_cache.bulk_load_fares(fare_rules)
-        except Exception as e:
-            print(f"Cache warmup failed: {e}")
     
     return _fare_cache
 
@@ -242,28 +339,95 @@ def get_zones_cache() -> ZonesCache:
     return _zones_cache
 
 
-import os
-# Example of how to integrate with existing fare calculator
-def get_fare_with_cache(from_zone: int, to_zone: int) -> float:
+def on_snapshot_reload(hook: Callable[[], None]) -> Callable[[], None]:
+    """Register a callback run after every snapshot reload (e.g. a cache_clear)."""
+    _reload_hooks.append(hook)
+    return hook
+
+
+def reload_fare_snapshot() -> FareRulesSnapshot:
+    """Rebuild the fare rules snapshot from the database."""
+    global _snapshot
+    db_manager = get_db_manager()
+    # The rules may have been changed by another process, so the manager's
+    # own zone and fare caches are stale too
+    db_manager.clear_caches()
+    _snapshot = FareRulesSnapshot(db_manager.get_all_fare_rules())
+    for hook in _reload_hooks:
+        hook()
+    return _snapshot
+
+
+def _listen_for_invalidations(redis_client):
+    """Reload the snapshot whenever another process publishes a change."""
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            for _message in pubsub.listen():
+                reload_fare_snapshot()
+        except Exception as e:
+            logger.warning("Fare rules invalidation listener error: %s", e)
+            time.sleep(1)
+
+
+def get_fare_snapshot() -> FareRulesSnapshot:
     """
-    Get fare using cache-first strategy.
+    Get the singleton fare rules snapshot.
     
-    This would replace direct database calls in the fare calculator.
+    The first call loads the snapshot and, when Redis is available,
+    starts a background thread that reloads it on invalidation messages.
     """
-    cache = get_fare_cache()
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                reload_fare_snapshot()
+                
+                redis_client = get_fare_cache().redis_client
+                if redis_client:
+                    threading.Thread(
+                        target=_listen_for_invalidations,
+                        args=(redis_client,),
+                        name="fare-rules-invalidation",
+                        daemon=True
+                    ).start()
     
-    # Try cache first
-    fare = cache.get_fare_cached(from_zone, to_zone)
-    if fare is not None:
-        return fare
+    return _snapshot
+
+
+def invalidate_fare_rules():
+    """
+    Reload this process's snapshot and notify other processes.
     
-    # Cache miss - fetch from database
-    from app.database import get_db_manager
-    db_manager = get_db_manager()
-    fare = db_manager.get_fare(from_zone, to_zone)
+    Call after any change to the fare rules table.
+    """
+    reload_fare_snapshot()
     
-    if fare is not None:
-        # Store in cache for next time
-        cache.set_fare_cache(from_zone, to_zone, fare)
+    redis_client = get_fare_cache().redis_client
+    if redis_client:
+        try:
+            redis_client.publish(INVALIDATION_CHANNEL, "1")
+        except Exception as e:
+            logger.warning("Redis publish error: %s", e)
+
+
+def get_fare_with_cache(from_zone: int, to_zone: int) -> float:
+    """
+    Get fare from the in-process fare rules snapshot.
+    
+    This indexes the snapshot's fare matrix: no Redis round-trip, no
+    database query and no tuple key per journey. The snapshot is kept
+    current by invalidate_fare_rules.
+    """
+    snapshot = _snapshot or get_fare_snapshot()
+    rows = snapshot.fare_rows
+    if rows is None:
+        key = (from_zone, to_zone) if from_zone <= to_zone else (to_zone, from_zone)
+        return snapshot.rules.get(key, 0.0)
     
-    return fare or 0.0
+    index = snapshot.zone_index
+    i = index.get(from_zone)
+    j = index.get(to_zone)
+    if i is None or j is None:
+        return 0.0
+    return rows[i][j]
@@ -1,11 +1,45 @@
 """Configuration for the PearlCard system."""
 
-from typing import Dict, Tuple, Optional
+from typing import Dict, FrozenSet, Tuple, Optional
+import logging
 import os
+import threading
+from functools import lru_cache
 from dotenv import load_dotenv
 
+from app.database import get_db_manager
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+try:
+    from app.cache import get_fare_snapshot, get_fare_with_cache, on_snapshot_reload
+except ImportError:
+    # Cache layer unavailable; fare lookups fall back to the database
+    get_fare_snapshot = None
+    get_fare_with_cache = None
+    on_snapshot_reload = None
+
+
+def _get_fare_from_database(from_zone: int, to_zone: int) -> float:
+    """
+    Get fare for a journey directly from the database.
+    Used when the cache layer cannot be imported.
+    """
+    try:
+        db_manager = get_db_manager()
+        fare = db_manager.get_fare(from_zone, to_zone)
+        if fare is not None:
+            return fare
+    except:
+        pass
+
+    # Fallback to cached rules
+    fare_rules = Settings.get_fare_rules()
+    zone_key = tuple(sorted([from_zone, to_zone]))
+    return fare_rules.get(zone_key, 0.0)
+
 
 class Settings:
     """Application settings."""
@@ -33,9 +67,13 @@ class Settings:
     # System Constraints - will be loaded from database
     MAX_JOURNEYS_PER_DAY = 20
 
+    # Highest zone number that can be added (API and manage_db)
+    MAX_ZONE_NUMBER = int(os.getenv("MAX_ZONE_NUMBER", "1000"))
+
     # Cached fare rules and zones (loaded from database)
     _fare_rules_cache: Optional[Dict[Tuple[int, int], float]] = None
-    _zones_cache: Optional[list] = None
+    _valid_zone_set: Optional[FrozenSet[int]] = None
+    _valid_zone_set_lock = threading.Lock()
 
     @classmethod
     def get_fare_rules(cls) -> Dict[Tuple[int, int], float]:
@@ -45,12 +83,10 @@ class Settings:
         """
         if cls._fare_rules_cache is None:
             try:
-                from app.database import get_db_manager
-
                 db_manager = get_db_manager()
                 cls._fare_rules_cache = db_manager.get_all_fare_rules()
             except Exception as e:
-                print(f"Warning: Could not load fare rules from database: {e}")
+                logger.warning("Could not load fare rules from database: %s", e)
                 # Fallback to minimal default rules
                 cls._fare_rules_cache = {
                     (1, 1): 40.0,
@@ -62,78 +98,82 @@ class Settings:
                 }
         return cls._fare_rules_cache
 
+    # get_fare(from_zone, to_zone) -> float
+    # Bound directly to the cache-layer lookup (resolved once at import) so
+    # each call is a single function call with no per-call import or
+    # dispatch; falls back to the database when the cache is unavailable.
+    get_fare = staticmethod(get_fare_with_cache or _get_fare_from_database)
+
     @classmethod
-    def get_fare(cls, from_zone: int, to_zone: int) -> float:
+    def get_fare_rules_snapshot(cls):
         """
-        Get fare for a journey between two zones.
-        Uses caching for performance with millions of users.
-
-        Args:
-            from_zone: Starting zone
-            to_zone: Ending zone
-
-        Returns:
-            Fare amount for the journey
+        Get the fare rules snapshot with its dense fare matrix and zone index.
+        Rebuilt on every zone/rule change; None when the cache layer is
+        unavailable.
         """
-        # Try cache-enabled path first
-        try:
-            from app.cache import get_fare_with_cache
-
-            return get_fare_with_cache(from_zone, to_zone)
-        except ImportError:
-            # Fallback to direct database access if cache not available
-            pass
-
-        # Original database logic
-        try:
-            from app.database import get_db_manager
-
-            db_manager = get_db_manager()
-            fare = db_manager.get_fare(from_zone, to_zone)
-            if fare is not None:
-                return fare
-        except:
-            pass
-
-        # Fallback to cached rules
-        fare_rules = cls.get_fare_rules()
-        zone_key = tuple(sorted([from_zone, to_zone]))
-        return fare_rules.get(zone_key, 0.0)
+        if get_fare_snapshot is None:
+            return None
+        return get_fare_snapshot()
 
     @classmethod
     def reload_fare_rules(cls):
         """Force reload of fare rules and zones from database."""
         cls._fare_rules_cache = None
-        cls._zones_cache = None
         cls.get_fare_rules()
-        cls.get_available_zones()
+        cls.refresh_valid_zones()
+
+    @classmethod
+    def refresh_valid_zones(cls) -> FrozenSet[int]:
+        """
+        Reload zones from the database and rebuild the valid zone set.
+        Only the rebuild takes the lock; is_valid_zone reads the frozenset
+        without locking since rebinding the attribute is atomic.
+        If the database can't be read the set is left unset, so the next
+        is_valid_zone call retries instead of rejecting every zone.
+        """
+        with cls._valid_zone_set_lock:
+            cls.clear_zone_caches()
+            try:
+                zones = frozenset(cls._load_available_zones())
+            except Exception as e:
+                logger.warning("Cannot load zones from database: %s", e)
+                cls._valid_zone_set = None
+                return frozenset()
+            cls._valid_zone_set = zones
+        return zones
 
     @classmethod
     def is_valid_zone(cls, zone: int) -> bool:
         """Check if a zone number is valid (exists in database)."""
-        try:
-            from app.database import get_db_manager
+        zones = cls._valid_zone_set
+        if zones is None:
+            # If database is not available this is empty and the zone is
+            # rejected; the next call tries the database again
+            zones = cls.refresh_valid_zones()
+        return zone in zones
 
-            db_manager = get_db_manager()
-            return db_manager.is_valid_zone(zone)
-        except Exception as e:
-            # If database is not available, reject all zones
-            print(f"Warning: Cannot validate zone {zone}, database error: {e}")
-            return False
+    @classmethod
+    def clear_zone_caches(cls):
+        """Forget the memoized zone list."""
+        cls._load_available_zones.cache_clear()
+
+    # The zone list is memoized until clear_zone_caches() runs, which
+    # refresh_valid_zones does after every zone/rule change. Database
+    # errors propagate through the cache, so a failed load isn't memoized.
+    @classmethod
+    @lru_cache(maxsize=1)
+    def _load_available_zones(cls) -> list:
+        """Load the zone list from the database (memoized on success)."""
+        return get_db_manager().get_available_zones()
 
     @classmethod
     def get_available_zones(cls) -> list:
         """Get list of available zones from database."""
-        if cls._zones_cache is None:
-            try:
-                from app.database import get_db_manager
-
-                db_manager = get_db_manager()
-                cls._zones_cache = db_manager.get_available_zones()
-            except Exception as e:
-                print(f"Warning: Cannot load zones from database: {e}")
-                cls._zones_cache = []  # Empty list if database unavailable
-        return cls._zones_cache
+        try:
+            return cls._load_available_zones()
+        except Exception as e:
+            logger.warning("Cannot load zones from database: %s", e)
+            return []  # Empty list if database unavailable; retried next call
 
     @classmethod
     def get_min_zone(cls) -> int:
@@ -149,3 +189,7 @@ class Settings:
 
 
 settings = Settings()
+
+if on_snapshot_reload is not None:
+    # Zone changes made by other workers arrive as snapshot reloads
+    on_snapshot_reload(Settings.refresh_valid_zones)
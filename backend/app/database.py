@@ -1,9 +1,11 @@
 """Database models and setup for PearlCard system."""
 
-from sqlalchemy import create_engine, Column, Integer, Float, String, UniqueConstraint
+from sqlalchemy import create_engine, event, insert, select, union, Column, Integer, Float, String, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-from typing import Optional, Set
+from sqlalchemy.orm import sessionmaker, scoped_session, Session
+from contextlib import contextmanager
+from fastapi import Depends
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 import os
 
 Base = declarative_base()
@@ -19,9 +21,11 @@ class FareRuleDB(Base):
     fare = Column(Float, nullable=False)
     description = Column(String, nullable=True)
     
-    # Ensure unique combination of from_zone and to_zone
+    # Ensure unique combination of from_zone and to_zone. Pairs are stored
+    # as (lower, higher) so each lookup is a single probe of this index.
     __table_args__ = (
         UniqueConstraint('from_zone', 'to_zone', name='_zone_pair_uc'),
+        Index('ix_fare_zone_pair', 'from_zone', 'to_zone'),
     )
     
     def __repr__(self):
@@ -41,32 +45,197 @@ class SystemConfigDB(Base):
         return f"<SystemConfig(key={self.key}, value={self.value})>"
 
 
+def _is_memory_sqlite(database_url: str) -> bool:
+    """Whether a SQLite URL names an in-memory database (e.g. the test database)."""
+    return database_url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in database_url
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Enable WAL journaling and relaxed syncing on each new SQLite connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+    finally:
+        cursor.close()
+
+
+def _set_memory_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Set up a connection to an in-memory SQLite database.
+    
+    Journaling, syncing and mmap only matter for a database file, so
+    in-memory databases skip those pragmas. They are used for tests, which
+    roll back through SAVEPOINTs, so transaction control is taken from
+    pysqlite here (SQLAlchemy's pysqlite savepoint recipe); file databases
+    keep the driver's default transaction handling.
+    """
+    # pysqlite otherwise commits implicitly around SAVEPOINTs;
+    # _begin_sqlite_transaction emits BEGIN instead
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def _begin_sqlite_transaction(connection):
+    """Start SQLite transactions explicitly (see _set_memory_sqlite_pragmas)."""
+    connection.exec_driver_sql("BEGIN")
+
+
 class DatabaseManager:
     """Manager class for database operations."""
     
-    def __init__(self, database_url: Optional[str] = None):
-        """Initialize database connection."""
+    def __init__(self, database_url: Optional[str] = None, create_tables: bool = True,
+                 **engine_kwargs):
+        """
+        Initialize database connection.
+        
+        Args:
+            database_url: Database URL (defaults to DATABASE_URL)
+            create_tables: Create missing tables now (bootstrap() defers
+                this to its own transaction)
+            **engine_kwargs: Extra create_engine() options, overriding the
+                defaults; passing a poolclass (e.g. StaticPool for an
+                in-memory SQLite database) drops the queue pool sizing
+        """
         self.database_url = database_url or os.getenv(
             "DATABASE_URL", 
             "sqlite:///./pearlcard_fare_rules.db"
         )
         
-        # Create engine with appropriate settings for SQLite
+        # Create a pooled engine once; sessions borrow connections from it
         connect_args = {"check_same_thread": False} if "sqlite" in self.database_url else {}
-        self.engine = create_engine(self.database_url, connect_args=connect_args)
+        engine_options = {"connect_args": connect_args, "pool_pre_ping": True}
+        if "poolclass" not in engine_kwargs:
+            engine_options.update(
+                pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+                max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "40")),
+                pool_recycle=3600
+            )
+        engine_options.update(engine_kwargs)
+        self.engine = create_engine(self.database_url, **engine_options)
         
-        # Create session factory
-        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        # Let readers and the occasional writer proceed concurrently
+        if self.database_url.startswith("sqlite"):
+            if _is_memory_sqlite(self.database_url):
+                event.listen(self.engine, "connect", _set_memory_sqlite_pragmas)
+                event.listen(self.engine, "begin", _begin_sqlite_transaction)
+            else:
+                event.listen(self.engine, "connect", _set_sqlite_pragmas)
+        
+        # Session factory for per-request sessions, plus a thread-local
+        # registry for callers that don't pass a session explicitly
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.SessionLocal = scoped_session(self.session_factory)
+        
+        # Zones as a frozenset for membership tests, and every rule keyed
+        # by (from_zone, to_zone) for get_fare; both are reset on writes
+        self._zone_set: Optional[frozenset] = None
+        self._fare_cache: Optional[Dict[Tuple[int, int], float]] = None
         
         # Create tables if they don't exist
-        Base.metadata.create_all(bind=self.engine)
+        if create_tables:
+            Base.metadata.create_all(bind=self.engine)
+    
+    @classmethod
+    def bootstrap(cls, database_url: Optional[str] = None, **engine_kwargs) -> "DatabaseManager":
+        """
+        Create a manager, its tables and the default rules in one transaction.
+        
+        Schema creation and seeding share a single connection and commit,
+        instead of committing once for the tables and again for the rules.
+        (On a SQLite file, pysqlite runs the CREATE TABLE statements outside
+        the transaction; the rules and config still commit once.)
+        
+        Args:
+            database_url: Database URL (defaults to DATABASE_URL)
+            **engine_kwargs: Extra create_engine() options, as for __init__
+        """
+        manager = cls(database_url, create_tables=False, **engine_kwargs)
+        with manager.session_factory() as session:
+            Base.metadata.create_all(bind=session.connection())
+            # Commits the tables and the rules together
+            manager.init_default_fare_rules(session)
+        return manager
+    
+    def clear_caches(self):
+        """
+        Drop the in-process zone and fare caches.
+        
+        Called after this manager writes, and by the cache layer whenever
+        the fare rules snapshot reloads (e.g. on another process's write).
+        """
+        self._zone_set = None
+        self._fare_cache = None
     
     def get_session(self) -> Session:
-        """Get a new database session."""
+        """Get the database session for the current thread."""
         return self.SessionLocal()
     
-    def init_default_fare_rules(self):
-        """Initialize database with default fare rules."""
+    @contextmanager
+    def session_scope(self, session: Optional[Session] = None) -> Iterator[Session]:
+        """
+        Use the given session, or open one for the duration of the block.
+        
+        Sessions passed in by the caller (e.g. a request-scoped session
+        from get_db) are left open; only sessions opened here are closed.
+        """
+        if session is not None:
+            yield session
+            return
+        
+        session = self.get_session()
+        try:
+            yield session
+        finally:
+            session.close()
+    
+    def _fold_reversed_pairs(self, session: Session) -> int:
+        """
+        Rewrite rules stored as (high, low) into (low, high) order.
+        
+        Rules are written and looked up with the lower zone first, so rows
+        left reversed by older versions would be missed by session lookups
+        and duplicated by updates. A reversed row is swapped in place, or
+        dropped when a (low, high) row for the pair already exists, which
+        is the row lookups have always preferred. Flushed, not committed.
+        
+        Returns:
+            Number of reversed rows folded
+        """
+        reversed_rules = session.query(FareRuleDB).filter(
+            FareRuleDB.from_zone > FareRuleDB.to_zone
+        ).all()
+        if not reversed_rules:
+            return 0
+        
+        normalized = set(session.execute(
+            select(FareRuleDB.from_zone, FareRuleDB.to_zone)
+            .where(FareRuleDB.from_zone <= FareRuleDB.to_zone)
+        ).tuples())
+        for rule in reversed_rules:
+            pair = (rule.to_zone, rule.from_zone)
+            if pair in normalized:
+                session.delete(rule)
+            else:
+                rule.from_zone, rule.to_zone = pair
+                rule.description = f"Zone {pair[0]} to Zone {pair[1]}"
+                normalized.add(pair)
+        session.flush()
+        return len(reversed_rules)
+    
+    def init_default_fare_rules(self, session: Optional[Session] = None):
+        """
+        Initialize database with default fare rules.
+        
+        Also folds any rules stored in (high, low) order into (low, high)
+        order, in the same transaction.
+        """
         # Default rules for initial zones 1-3
         default_rules = [
             (1, 1, 40.0, "Zone 1 to Zone 1"),
@@ -77,21 +246,20 @@ class DatabaseManager:
             (3, 3, 30.0, "Zone 3 to Zone 3"),
         ]
         
-        session = self.get_session()
-        try:
+        with self.session_scope(session) as session:
+            folded = self._fold_reversed_pairs(session)
+            if folded:
+                print(f"Normalized {folded} reversed fare rules")
+            
             # Check if rules already exist
             existing_count = session.query(FareRuleDB).count()
-            if existing_count == 0:
-                # Add default rules
-                for from_zone, to_zone, fare, desc in default_rules:
-                    rule = FareRuleDB(
-                        from_zone=from_zone,
-                        to_zone=to_zone,
-                        fare=fare,
-                        description=desc
-                    )
-                    session.add(rule)
-                session.commit()
+            seeded = existing_count == 0
+            if seeded:
+                # Add default rules in a single executemany
+                session.execute(insert(FareRuleDB), [
+                    {"from_zone": from_zone, "to_zone": to_zone, "fare": fare, "description": desc}
+                    for from_zone, to_zone, fare, desc in default_rules
+                ])
                 print(f"Initialized {len(default_rules)} default fare rules")
             
             # Initialize system config
@@ -103,73 +271,95 @@ class DatabaseManager:
                     description="Maximum number of journeys allowed per day"
                 )
                 session.add(config)
-                session.commit()
                 print("Initialized system configuration")
-                
-        finally:
-            session.close()
+            
+            # Rules and config land in one transaction
+            session.commit()
+            if seeded or folded:
+                self.clear_caches()
     
-    def get_all_fare_rules(self):
+    def get_all_fare_rules(self, session: Optional[Session] = None):
         """Retrieve all fare rules from database."""
-        session = self.get_session()
-        try:
-            rules = session.query(FareRuleDB).all()
-            return {
-                (rule.from_zone, rule.to_zone): rule.fare
-                for rule in rules
-            }
-        finally:
-            session.close()
+        with self.session_scope(session) as session:
+            rows = session.execute(
+                select(FareRuleDB.from_zone, FareRuleDB.to_zone, FareRuleDB.fare)
+            ).all()
+        return {(row.from_zone, row.to_zone): row.fare for row in rows}
+    
+    def get_rules_and_zones(
+        self, session: Optional[Session] = None
+    ) -> Tuple[Dict[Tuple[int, int], float], List[int]]:
+        """
+        Get all fare rules and the zones they cover in a single query.
+        
+        Selects plain column tuples rather than ORM objects, so no
+        instances are hydrated or tracked in the identity map.
+        
+        Returns:
+            Tuple of (rules dict keyed by (from_zone, to_zone), sorted zones)
+        """
+        with self.session_scope(session) as session:
+            rows = session.execute(
+                select(FareRuleDB.from_zone, FareRuleDB.to_zone, FareRuleDB.fare)
+            ).all()
+        
+        rules_dict = {(r[0], r[1]): r[2] for r in rows}
+        zones = sorted({z for r in rows for z in (r[0], r[1])})
+        return rules_dict, zones
     
-    def get_available_zones(self) -> list:
+    def get_available_zones(self, session: Optional[Session] = None) -> list:
         """Get all unique zones from the database."""
-        session = self.get_session()
-        try:
-            rules = session.query(FareRuleDB).all()
-            zones = set()
-            for rule in rules:
-                zones.add(rule.from_zone)
-                zones.add(rule.to_zone)
-            return sorted(list(zones)) if zones else []  # Return empty list if no zones
-        finally:
-            session.close()
+        zones = union(
+            select(FareRuleDB.from_zone.label("z")),
+            select(FareRuleDB.to_zone.label("z"))
+        ).subquery()
+        with self.session_scope(session) as session:
+            # Empty list if no zones
+            return list(session.execute(
+                select(zones.c.z).distinct().order_by(zones.c.z)
+            ).scalars().all())
     
-    def get_min_max_zones(self) -> tuple:
+    def get_min_max_zones(self, session: Optional[Session] = None) -> tuple:
         """Get minimum and maximum zone numbers."""
-        zones = self.get_available_zones()
+        zones = self.get_available_zones(session)
         if zones:
             return min(zones), max(zones)
         return None, None  # No defaults if database is empty
     
-    def is_valid_zone(self, zone: int) -> bool:
+    def is_valid_zone(self, zone: int, session: Optional[Session] = None) -> bool:
         """Check if a zone number exists in the database."""
-        zones = self.get_available_zones()
-        return zone in zones
+        if self._zone_set is None:
+            self._zone_set = frozenset(self.get_available_zones(session))
+        return zone in self._zone_set
     
-    def get_fare(self, from_zone: int, to_zone: int) -> Optional[float]:
-        """Get fare for a specific zone pair."""
-        session = self.get_session()
-        try:
-            # Try exact match first
-            rule = session.query(FareRuleDB).filter_by(
-                from_zone=from_zone,
-                to_zone=to_zone
-            ).first()
-            
-            if rule:
-                return rule.fare
-            
-            # Try reversed zones (since fare is same both ways)
-            rule = session.query(FareRuleDB).filter_by(
-                from_zone=to_zone,
-                to_zone=from_zone
-            ).first()
-            
-            return rule.fare if rule else None
-        finally:
-            session.close()
+    def get_fare(self, from_zone: int, to_zone: int, session: Optional[Session] = None) -> Optional[float]:
+        """
+        Get fare for a specific zone pair (same fare in both directions).
+        
+        Answered from the in-process rule cache, which is loaded with one
+        query on first use and reset on writes, including other processes'
+        writes via the fare snapshot reload. A caller-supplied session may
+        see writes not yet committed, so those lookups still go to the
+        database.
+        """
+        z1, z2 = sorted((from_zone, to_zone))
+        if session is None:
+            fares = self._fare_cache
+            if fares is None:
+                fares = self._fare_cache = self.get_all_fare_rules()
+            fare = fares.get((z1, z2))
+            return fare if fare is not None else fares.get((z2, z1))
+        
+        with self.session_scope(session) as session:
+            return session.execute(
+                select(FareRuleDB.fare).where(
+                    FareRuleDB.from_zone == z1,
+                    FareRuleDB.to_zone == z2
+                )
+            ).scalar()
     
-    def add_zone(self, zone_number: int, fares_to_existing_zones: dict):
+    def add_zone(self, zone_number: int, fares_to_existing_zones: dict,
+                 session: Optional[Session] = None):
         """
         Add a new zone with fare rules to all existing zones.
         
@@ -177,28 +367,31 @@ class DatabaseManager:
             zone_number: The new zone number
             fares_to_existing_zones: Dict mapping existing zones to fares
                                     e.g., {1: 75.0, 2: 60.0, 3: 50.0, 4: 25.0}
+            session: Optional session to run in (a new one is opened if omitted)
         """
-        session = self.get_session()
-        try:
-            for existing_zone, fare in fares_to_existing_zones.items():
-                # Add fare rule for new zone to existing zone
-                rule = FareRuleDB(
-                    from_zone=zone_number,
-                    to_zone=existing_zone,
-                    fare=fare,
-                    description=f"Zone {zone_number} to Zone {existing_zone}"
-                )
-                session.add(rule)
-            
+        rows = []
+        for existing_zone, fare in fares_to_existing_zones.items():
+            # Fare rule for new zone to existing zone, stored as (low, high)
+            z1, z2 = sorted((zone_number, int(existing_zone)))
+            rows.append({
+                "from_zone": z1,
+                "to_zone": z2,
+                "fare": fare,
+                "description": f"Zone {z1} to Zone {z2}"
+            })
+        
+        with self.session_scope(session) as session:
+            # One executemany and one commit for the whole zone
+            session.execute(insert(FareRuleDB), rows)
             session.commit()
+            self.clear_caches()
             print(f"Added Zone {zone_number} with {len(fares_to_existing_zones)} fare rules")
-        finally:
-            session.close()
     
-    def update_fare_rule(self, from_zone: int, to_zone: int, new_fare: float):
-        """Update or create a fare rule."""
-        session = self.get_session()
-        try:
+    def update_fare_rule(self, from_zone: int, to_zone: int, new_fare: float,
+                         session: Optional[Session] = None):
+        """Update or create a fare rule (stored with the lower zone first)."""
+        from_zone, to_zone = sorted((from_zone, to_zone))
+        with self.session_scope(session) as session:
             rule = session.query(FareRuleDB).filter_by(
                 from_zone=from_zone,
                 to_zone=to_zone
@@ -216,18 +409,14 @@ class DatabaseManager:
                 session.add(rule)
             
             session.commit()
+            self.clear_caches()
             return rule
-        finally:
-            session.close()
     
-    def get_config_value(self, key: str) -> Optional[str]:
+    def get_config_value(self, key: str, session: Optional[Session] = None) -> Optional[str]:
         """Get a configuration value by key."""
-        session = self.get_session()
-        try:
+        with self.session_scope(session) as session:
             config = session.query(SystemConfigDB).filter_by(key=key).first()
             return config.value if config else None
-        finally:
-            session.close()
 
 
 # Singleton instance
@@ -235,9 +424,29 @@ _db_manager: Optional[DatabaseManager] = None
 
 
 def get_db_manager() -> DatabaseManager:
-    """Get singleton database manager instance."""
+    """
+    Get singleton database manager instance.
+    
+    Default rules are seeded once by the application startup hook (or
+    `python manage_db.py init`), not here, so whichever request first
+    touches the manager doesn't pay for it.
+    """
     global _db_manager
     if _db_manager is None:
         _db_manager = DatabaseManager()
-        _db_manager.init_default_fare_rules()
     return _db_manager
+
+
+def get_db(db_manager: DatabaseManager = Depends(get_db_manager)) -> Iterator[Session]:
+    """
+    FastAPI dependency yielding one session per request.
+    
+    All manager calls made while handling the request share this session,
+    so the request holds a single pooled connection instead of opening and
+    closing one per call.
+    """
+    db = db_manager.session_factory()
+    try:
+        yield db
+    finally:
+        db.close()
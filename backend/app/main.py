@@ -1,13 +1,25 @@
 """Main application entry point."""
 
+import logging
+import os
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
+from sqlalchemy import text
 
 from app.config import settings
 from app.api import router
 from app.database import get_db_manager
+from app.cache import get_fare_snapshot
+
+# Configure logging once for the application; debug output from the
+# cache hot path is not formatted unless the level is lowered
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
 
 
 @asynccontextmanager
@@ -21,6 +33,13 @@ async def lifespan(app: FastAPI):
     db_manager.init_default_fare_rules()
     print("Local datastore initialized successfully")
     
+    # Warm the connection pool and the fare snapshot so the first request
+    # after a worker boots doesn't pay for them
+    with db_manager.engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    get_fare_snapshot()
+    settings.refresh_valid_zones()
+    
     yield
     
     # Shutdown: Cleanup if needed
@@ -34,6 +53,7 @@ app = FastAPI(
     description=settings.API_DESCRIPTION,
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -64,7 +84,7 @@ async def root():
 @app.exception_handler(ValueError)
 async def value_error_handler(request, exc):
     """Handle value errors."""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=400,
         content={"detail": str(exc)}
     )
@@ -73,7 +93,7 @@ async def value_error_handler(request, exc):
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc):
     """Handle general exceptions."""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"detail": "Internal server error"}
     )
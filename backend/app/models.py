@@ -1,20 +1,32 @@
 """Models for the PearlCard fare calculation system."""
 
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing import List, Optional
 from enum import IntEnum
+from dataclasses import dataclass
+
+from app.config import settings
+
+# Bound once at import; the zone validator runs for every journey
+_is_valid_zone = settings.is_valid_zone
+
+# Request models are immutable once validated and reject unknown fields;
+# their validators are built at class creation, not on first use
+_REQUEST_MODEL_CONFIG = ConfigDict(frozen=True, extra='forbid', defer_build=False)
 
 
 class Journey(BaseModel):
     """Model representing a single journey."""
+    model_config = _REQUEST_MODEL_CONFIG
+    
     from_zone: int = Field(..., ge=1, description="Starting zone")
     to_zone: int = Field(..., ge=1, description="Ending zone")
     
-    @validator('from_zone', 'to_zone')
-    def validate_zone(cls, v):
-        # Dynamic zone validation - will check against database
-        from app.config import settings
-        if not settings.is_valid_zone(v):
+    @field_validator('from_zone', 'to_zone')
+    @classmethod
+    def validate_zone(cls, v: int) -> int:
+        # Dynamic zone validation per field, so a 422 names the bad field
+        if not _is_valid_zone(v):
             raise ValueError(f"Zone {v} is not valid. Check available zones from API.")
         return v
 
@@ -27,18 +39,14 @@ class JourneyWithFare(Journey):
 
 class JourneyRequest(BaseModel):
     """Request model for fare calculation."""
+    model_config = _REQUEST_MODEL_CONFIG
+    
     journeys: List[Journey] = Field(
         ...,
-        min_items=1,
-        max_items=20,
+        min_length=1,
+        max_length=20,
         description="List of journeys (max 20 per day)"
     )
-    
-    @validator('journeys')
-    def validate_journey_count(cls, v):
-        if len(v) > 20:
-            raise ValueError(f"Maximum 20 journeys allowed per day, got {len(v)}")
-        return v
 
 
 class FareResponse(BaseModel):
@@ -51,13 +59,43 @@ class FareResponse(BaseModel):
     journey_count: int = Field(..., description="Number of journeys")
 
 
-class FareRule(BaseModel):
-    """Model representing a fare rule."""
+class FareRuleDetail(BaseModel):
+    """A fare rule as listed by the fare rules endpoint."""
+    from_zone: int = Field(..., description="Lower zone of the pair")
+    to_zone: int = Field(..., description="Higher zone of the pair")
+    fare: float = Field(..., description="Fare in either direction")
+    description: str = Field(..., description="Human readable zone pair")
+
+
+class FareRulesResponse(BaseModel):
+    """Response model for the fare rules listing."""
+    rules: List[FareRuleDetail] = Field(..., description="All fare rules")
+    max_journeys_per_day: int = Field(..., description="Daily journey limit")
+    available_zones: List[int] = Field(..., description="Zones with fare rules, ascending")
+    min_zone: Optional[int] = Field(None, description="Lowest zone, if any")
+    max_zone: Optional[int] = Field(None, description="Highest zone, if any")
+    total_zones: int = Field(..., description="Number of available zones")
+    datastore: str = Field(..., description="Where the rules are stored")
+
+
+@dataclass(frozen=True)
+class FareRule:
+    """
+    Model representing a fare rule.
+    A plain frozen dataclass rather than a pydantic model: rules are read
+    from our own datastore, so there is nothing to validate.
+    """
+    # Declared by hand because dataclass(slots=True) needs Python 3.10;
+    # zone_key is a derived slot rather than a dataclass field
+    __slots__ = ("from_zone", "to_zone", "fare", "zone_key")
+    
     from_zone: int
     to_zone: int
     fare: float
     
-    @property
-    def zone_key(self) -> tuple:
-        """Generate a normalized key for zone combination."""
-        return tuple(sorted([self.from_zone, self.to_zone]))
+    def __post_init__(self):
+        # Normalized Tuple[int, int] key for the zone combination, computed once
+        object.__setattr__(
+            self, "zone_key",
+            (min(self.from_zone, self.to_zone), max(self.from_zone, self.to_zone))
+        )
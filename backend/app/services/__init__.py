@@ -1,8 +1,8 @@
 """Services package for PearlCard system."""
 
+from .interfaces import FareCalculatorInterface
 from .fare_calculator import (
     get_fare_calculator,
-    FareCalculatorInterface,
     ZoneBasedFareCalculator
 )
 
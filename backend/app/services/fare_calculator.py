@@ -1,105 +1,129 @@
 """Fare calculation service implementing business logic."""
 
-from typing import List, Protocol, runtime_checkable
-from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, Dict, List
+import math
+from functools import lru_cache
 
-from app.models import Journey, JourneyWithFare, FareResponse
+import numpy as np
+
+from app.models import Journey
 from app.config import settings
+from app.cache import on_snapshot_reload
+from app.services.interfaces import FareCalculatorInterface
+from app.services.kernels import gather_fares
 
 
-@runtime_checkable
-class FareCalculatorInterface(Protocol):
-    """
-    Interface for fare calculation (Dependency Inversion Principle).
-    This protocol defines the contract that all fare calculators must follow.
+@lru_cache(maxsize=1024)
+def _cached_fare(low_zone: int, high_zone: int) -> float:
+    """Fare for a sorted zone pair; cleared whenever the fare rules reload."""
+    return settings.get_fare(low_zone, high_zone)
+
+
+on_snapshot_reload(_cached_fare.cache_clear)
+
+
+def calculate_single_fare(journey: Journey) -> float:
     """
+    Calculate fare for a single journey based on zones.
     
-    def calculate_single_fare(self, journey: Journey) -> float:
-        """Calculate fare for a single journey."""
-        ...
-    
-    def calculate_all_fares(self, journeys: List[Journey]) -> FareResponse:
-        """Calculate fares for multiple journeys."""
-        ...
+    Args:
+        journey: Journey object with from_zone and to_zone
+        
+    Returns:
+        Fare for the journey's zone pair (0.0 if no rule exists)
+    """
+    a, b = journey.from_zone, journey.to_zone
+    return _cached_fare(a, b) if a <= b else _cached_fare(b, a)
 
 
-class BaseFareCalculator(ABC):
-    """Abstract base class for fare calculators (Open/Closed Principle)."""
-    
-    @abstractmethod
-    def calculate_single_fare(self, journey: Journey) -> float:
-        """
-        Calculate fare for a single journey.
-        Must be implemented by subclasses.
-        """
-        pass
+def _build_response(journeys: List[Journey], fares: List[float]) -> Dict[str, Any]:
+    """
+    Pair journeys with their fares and total them.
+    Built as plain dicts in the shape of FareResponse: zones were validated
+    on the incoming Journey and fares come from our own datastore, so
+    instantiating models only to serialize them straight away is wasted work.
+    The total is an exactly rounded math.fsum, rounded to pence once.
+    """
+    return {
+        "journeys": [
+            {
+                "from_zone": journey.from_zone,
+                "to_zone": journey.to_zone,
+                "fare": fare,
+                "journey_id": idx
+            }
+            for idx, (journey, fare) in enumerate(zip(journeys, fares), 1)
+        ],
+        "total_daily_fare": round(math.fsum(fares), 2),
+        "journey_count": len(journeys)
+    }
+
+
+def _fares_per_journey(journeys: List[Journey]) -> List[float]:
+    """Look up fares one journey at a time."""
+    return [calculate_single_fare(journey) for journey in journeys]
+
+
+def calculate_all_fares(journeys: List[Journey]) -> Dict[str, Any]:
+    """
+    Calculate fares for multiple journeys.
+    Prices the whole list with one gather over the dense fare matrix
+    instead of a lookup per journey; an unavailable or oversized matrix
+    (see MAX_MATRIX_ZONES) or zones outside it fall back to the
+    per-journey path.
     
-    def calculate_all_fares(self, journeys: List[Journey]) -> FareResponse:
-        """
-        Calculate fares for multiple journeys.
-        Default implementation that uses calculate_single_fare.
-        Can be overridden if needed for optimization.
-        """
-        journeys_with_fare = []
-        total_fare = 0.0
-        
-        for idx, journey in enumerate(journeys, 1):
-            fare = self.calculate_single_fare(journey)
-            journey_with_fare = JourneyWithFare(
-                from_zone=journey.from_zone,
-                to_zone=journey.to_zone,
-                fare=fare,
-                journey_id=idx
-            )
-            journeys_with_fare.append(journey_with_fare)
-            total_fare += fare
+    Args:
+        journeys: Journeys to price
         
-        return FareResponse(
-            journeys=journeys_with_fare,
-            total_daily_fare=round(total_fare, 2),
-            journey_count=len(journeys)
-        )
+    Returns:
+        Dict in the shape of FareResponse with per-journey fares and the daily total
+    """
+    snapshot = settings.get_fare_rules_snapshot() if journeys else None
+    if snapshot is None or snapshot.fare_matrix is None:
+        # No cache layer, or too many zones for a dense matrix
+        return _build_response(journeys, _fares_per_journey(journeys))
+    
+    # Map zone numbers to matrix positions; -1 (unknown zone) sends the
+    # request down the per-journey path
+    index = snapshot.zone_index
+    count: int = len(journeys)
+    from_arr = np.fromiter((index.get(j.from_zone, -1) for j in journeys), dtype=np.intp, count=count)
+    to_arr = np.fromiter((index.get(j.to_zone, -1) for j in journeys), dtype=np.intp, count=count)
+    journey_fares = gather_fares(from_arr, to_arr, snapshot.fare_matrix)
+    if journey_fares is None:
+        return _build_response(journeys, _fares_per_journey(journeys))
+    
+    return _build_response(journeys, journey_fares.tolist())
 
 
-class ZoneBasedFareCalculator(BaseFareCalculator):
+class ZoneBasedFareCalculator:
     """
-    Concrete implementation of fare calculator based on zones.
-    Follows Single Responsibility Principle - only handles fare calculation.
-    Retrieves fare rules from the local datastore.
+    Zone-based fare calculator satisfying FareCalculatorInterface.
+    A thin shim over the module-level functions, kept for callers that
+    inject a calculator object.
     """
     
-    def __init__(self):
-        """Initialize the fare calculator."""
-        pass  # Fare rules are now fetched from database via settings
-    
     def calculate_single_fare(self, journey: Journey) -> float:
-        """
-        Calculate fare for a single journey based on zones.
-        Retrieves fare from local datastore.
-        
-        Args:
-            journey: Journey object with from_zone and to_zone
-            
-        Returns:
-            Calculated fare amount from database
-        """
-        return settings.get_fare(journey.from_zone, journey.to_zone)
+        """Calculate fare for a single journey based on zones."""
+        return calculate_single_fare(journey)
     
-    # calculate_all_fares is inherited from BaseFareCalculator
+    def calculate_all_fares(self, journeys: List[Journey]) -> Dict[str, Any]:
+        """Calculate fares for multiple journeys."""
+        return calculate_all_fares(journeys)
 
 
-# Singleton instance for default calculator
-_default_calculator: FareCalculatorInterface = None
+if TYPE_CHECKING:
+    # Protocol conformance, checked by mypy (and the mypyc build) rather
+    # than by an isinstance walk at runtime
+    _conforms: FareCalculatorInterface = ZoneBasedFareCalculator()
 
 
+@lru_cache(maxsize=None)
 def get_fare_calculator() -> FareCalculatorInterface:
     """
-    Get the default fare calculator instance (Singleton pattern).
+    Get the default fare calculator instance (created once, then cached).
     
     Returns:
         Fare calculator instance implementing FareCalculatorInterface
     """
-    global _default_calculator
-    if _default_calculator is None:
-        _default_calculator = ZoneBasedFareCalculator()
-    return _default_calculator
+    return ZoneBasedFareCalculator()
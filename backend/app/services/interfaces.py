@@ -0,0 +1,28 @@
+"""Interfaces for the fare calculation services.
+
+Kept apart from fare_calculator.py so that module can be compiled with
+mypyc while this Protocol stays an ordinary Python class. It is a
+typing-only contract: conformance is checked statically, not with isinstance.
+"""
+
+from typing import Any, Dict, List, Protocol
+
+from app.models import Journey
+
+
+class FareCalculatorInterface(Protocol):
+    """
+    Interface for fare calculation (Dependency Inversion Principle).
+    This protocol defines the contract that all fare calculators must follow.
+    """
+    
+    def calculate_single_fare(self, journey: Journey) -> float:
+        """Calculate fare for a single journey."""
+        ...
+    
+    def calculate_all_fares(self, journeys: List[Journey]) -> Dict[str, Any]:
+        """
+        Calculate fares for multiple journeys.
+        Returns a dict in the shape of FareResponse, ready to serialize.
+        """
+        ...
@@ -0,0 +1,75 @@
+"""Numeric kernels for fare calculation.
+
+Kept out of fare_calculator.py, which may be compiled with mypyc, because
+numba JIT-compiles plain Python functions from their bytecode. numba is
+optional: without it the kernels fall back to NumPy fancy indexing.
+
+Kernels are compiled eagerly for the signatures the calculator uses, and
+cache=True keeps the machine code on disk, so importing a warmed module
+(see the Dockerfile) loads it instead of JIT-compiling on the first request.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, types
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+    # Zone indices come from np.fromiter; the snapshot's fare matrix is
+    # read-only, but callers may also pass a writable one
+    _ZONE_ARRAY = types.Array(types.intp, 1, "C")
+    _GATHER_SIGNATURES = [
+        types.Tuple((types.Array(types.float64, 1, "C"), types.boolean))(
+            _ZONE_ARRAY, _ZONE_ARRAY, types.Array(types.float64, 2, "C", readonly=readonly)
+        )
+        for readonly in (True, False)
+    ]
+    
+    @njit(_GATHER_SIGNATURES, cache=True)
+    def _gather_fares_jit(from_zones, to_zones, fare_matrix):
+        # One pass that bounds-checks and gathers, instead of max() + fancy index
+        size = fare_matrix.shape[0]
+        fares = np.empty(from_zones.size, dtype=fare_matrix.dtype)
+        for i in range(from_zones.size):
+            a = from_zones[i]
+            b = to_zones[i]
+            if a < 0 or b < 0 or a >= size or b >= size:
+                return fares, False
+            fares[i] = fare_matrix[a, b]
+        return fares, True
+
+
+def gather_fares(from_zones: np.ndarray, to_zones: np.ndarray,
+                 fare_matrix: np.ndarray):
+    """
+    Look up each journey's fare in the dense fare matrix.
+
+    Args:
+        from_zones: Matrix positions of the journey start zones
+        to_zones: Matrix positions of the journey end zones (same length)
+        fare_matrix: Fares indexed by [from position, to position]
+
+    Returns:
+        Array of fares, or None if any position falls outside the matrix
+    """
+    if NUMBA_AVAILABLE:
+        # No-ops for the calculator's arrays; other inputs are converted to
+        # one of the compiled signatures rather than rejected
+        fares, in_range = _gather_fares_jit(
+            np.ascontiguousarray(from_zones, dtype=np.intp),
+            np.ascontiguousarray(to_zones, dtype=np.intp),
+            np.ascontiguousarray(fare_matrix, dtype=np.float64)
+        )
+        return fares if in_range else None
+
+    if from_zones.size == 0:
+        return fare_matrix[from_zones, to_zones]
+    size = len(fare_matrix)
+    if (min(from_zones.min(), to_zones.min()) < 0
+            or max(from_zones.max(), to_zones.max()) >= size):
+        return None
+    return fare_matrix[from_zones, to_zones]
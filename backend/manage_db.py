@@ -14,21 +14,45 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.database import DatabaseManager
+
+def _get_db():
+    """Get the app's DatabaseManager singleton, created on first use."""
+    # Imported lazily so printing usage doesn't pay for SQLAlchemy/app imports
+    from app.database import get_db_manager
+    return get_db_manager()
+
+
+def _invalidate_servers():
+    """
+    Tell running servers that the fare rules changed.
+    
+    Only publishes on the Redis invalidation channel: every server process
+    reloads its fare snapshot and the caches derived from it, and the CLI
+    builds no snapshot of its own. Without Redis, servers only pick up the
+    change on restart.
+    """
+    from app.cache import INVALIDATION_CHANNEL
+    try:
+        import redis
+        redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
+        redis_client.publish(INVALIDATION_CHANNEL, "1")
+    except Exception as e:
+        print(f"Running servers not notified (restart them to apply): {e}")
 
 
 def init_database():
     """Initialize database with default fare rules."""
     print("Initializing database...")
-    db = DatabaseManager()
+    db = _get_db()
     db.init_default_fare_rules()
+    _invalidate_servers()
     print("Database initialized successfully!")
     show_rules()
 
 
 def show_rules():
     """Display all fare rules."""
-    db = DatabaseManager()
+    db = _get_db()
     rules = db.get_all_fare_rules()
     
     print("\n" + "="*50)
@@ -55,7 +79,7 @@ def update_rule():
     print("-"*30)
     
     try:
-        db = DatabaseManager()
+        db = _get_db()
         available_zones = db.get_available_zones()
         
         print(f"Available zones: {available_zones}")
@@ -81,6 +105,7 @@ def update_rule():
             return
         
         db.update_fare_rule(from_zone, to_zone, new_fare)
+        _invalidate_servers()
         print(f"✓ Updated fare for Zone {from_zone} → Zone {to_zone} to £{new_fare}")
         
     except ValueError:
@@ -94,9 +119,14 @@ def reset_database():
     confirm = input("Are you sure you want to reset all fare rules to defaults? (yes/no): ")
     
     if confirm.lower() == 'yes':
-        import os
+        from app import database
         db_path = "./pearlcard_fare_rules.db"
         if os.path.exists(db_path):
+            # Close the old file's connections and start over with a new
+            # manager, which recreates the tables
+            if database._db_manager is not None:
+                database._db_manager.engine.dispose()
+                database._db_manager = None
             os.remove(db_path)
             print("Database deleted.")
         
@@ -112,13 +142,18 @@ def add_new_zone():
     print("-"*30)
     
     try:
-        db = DatabaseManager()
+        db = _get_db()
         existing_zones = db.get_available_zones()
         
         print(f"Current zones: {existing_zones}")
         
         zone_number = int(input("\nEnter new zone number: "))
         
+        from app.config import Settings
+        if not 1 <= zone_number <= Settings.MAX_ZONE_NUMBER:
+            print(f"Zone number must be between 1 and {Settings.MAX_ZONE_NUMBER}!")
+            return
+        
         if zone_number in existing_zones:
             print(f"Zone {zone_number} already exists!")
             return
@@ -137,6 +172,7 @@ def add_new_zone():
         
         # Add the zone
         db.add_zone(zone_number, fares)
+        _invalidate_servers()
         
         print(f"\n✓ Zone {zone_number} added successfully!")
         show_rules()
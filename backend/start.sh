@@ -7,5 +7,11 @@ chmod 755 /app/data
 
 echo "Data directory created/verified at /app/data"
 
+# Reload on code changes only in development (docker-compose.dev.yml)
+RELOAD_FLAG=""
+if [ "${UVICORN_RELOAD:-0}" = "1" ]; then
+    RELOAD_FLAG="--reload"
+fi
+
 # Start the application
-exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
+exec uvicorn app.main:app --host 0.0.0.0 --port 8000 $RELOAD_FLAG
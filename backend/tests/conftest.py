@@ -0,0 +1,71 @@
+"""Shared fixtures for the fare calculation test suite."""
+
+import pytest
+from sqlalchemy import delete, select
+
+from app.cache import reload_fare_snapshot
+from app.config import settings
+from app.database import FareRuleDB, get_db_manager
+from app.services.fare_calculator import ZoneBasedFareCalculator
+
+
+@pytest.fixture(scope="session")
+def calculator():
+    """One fare calculator shared by every test."""
+    return ZoneBasedFareCalculator()
+
+
+@pytest.fixture(scope="session")
+def db_manager():
+    """The application's database manager, shared by every test."""
+    return get_db_manager()
+
+
+@pytest.fixture(scope="session")
+def rules(db_manager):
+    """Every fare rule, fetched once for the tests that only read them."""
+    return db_manager.get_all_fare_rules()
+
+
+@pytest.fixture
+def db_session(db_manager):
+    """
+    Session whose writes are rolled back when the test ends.
+    
+    The session runs inside an outer transaction on its own connection;
+    commits made by the code under test only release savepoints.
+    """
+    connection = db_manager.engine.connect()
+    transaction = connection.begin()
+    session = db_manager.session_factory(
+        bind=connection,
+        join_transaction_mode="create_savepoint"
+    )
+    try:
+        yield session
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
+
+
+
+@pytest.fixture
+def restore_fare_rules(db_manager):
+    """
+    Undo fare rule changes committed by the app once the test ends.
+    
+    For API tests, whose requests commit on the app's own sessions: rows
+    the test added are deleted, original fares are put back and every
+    fare rule cache is reloaded.
+    """
+    with db_manager.session_factory() as session:
+        original_fares = dict(session.execute(select(FareRuleDB.id, FareRuleDB.fare)).all())
+    yield
+    with db_manager.session_factory() as session:
+        session.execute(delete(FareRuleDB).where(FareRuleDB.id.not_in(original_fares)))
+        for rule in session.scalars(select(FareRuleDB)):
+            rule.fare = original_fares[rule.id]
+        session.commit()
+    settings.reload_fare_rules()
+    reload_fare_snapshot()
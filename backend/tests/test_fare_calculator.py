@@ -1,378 +1,747 @@
 """Unit tests for fare calculation system."""
 
+import asyncio
+import fakeredis
+import itertools
+import threading
+import numpy as np
+import orjson
 import pytest
-from fastapi.testclient import TestClient
+from dataclasses import FrozenInstanceError
+from httpx import ASGITransport, AsyncClient
+from pydantic import ValidationError
 from typing import List
-import tempfile
 import os
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool
 
 from app.main import app
-from app.models import Journey, JourneyRequest, FareResponse
+from app.models import Journey, JourneyRequest, FareResponse, FareRule, FareRulesResponse
+from app.services import kernels
 from app.services.fare_calculator import (
     FareCalculatorInterface,
-    ZoneBasedFareCalculator
+    ZoneBasedFareCalculator,
+    _cached_fare
 )
 from app.config import settings
-from app.database import DatabaseManager
+from app import cache as cache_layer, config, database
+from app.cache import FareRulesCache, FareRulesSnapshot, ZonesCache, reload_fare_snapshot
+from app.database import DatabaseManager, FareRuleDB
 
-# Use a temporary database for testing
-test_db = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
-os.environ["DATABASE_URL"] = f"sqlite:///{test_db.name}"
+# Use a shared in-memory database for testing: no file, journal or fsync.
+# Each pytest-xdist worker gets its own, so workers never see each other's writes
+TEST_WORKER = os.environ.get("PYTEST_XDIST_WORKER", "gw0")
+TEST_DATABASE_URL = f"sqlite:///file:pearl_{TEST_WORKER}?mode=memory&cache=shared&uri=true"
+os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+# Create and seed the test database in one transaction, on a single pinned
+# connection which also keeps the in-memory database alive for the whole run
+test_db_manager = DatabaseManager.bootstrap(
+    TEST_DATABASE_URL,
+    connect_args={"uri": True, "check_same_thread": False},
+    poolclass=StaticPool
+)
+
+# Point the app's manager singleton at the same engine
+database._db_manager = test_db_manager
+
+# Request bodies are encoded once up front rather than on every post
+JSON_HEADERS = {"content-type": "application/json"}
+ONE_ZONE_JOURNEY = {"from_zone": 1, "to_zone": 1}
+MAX_JOURNEYS_BODY = orjson.dumps({"journeys": [ONE_ZONE_JOURNEY] * 20})
+TOO_MANY_JOURNEYS_BODY = orjson.dumps({"journeys": [ONE_ZONE_JOURNEY] * 21})
+INVALID_ZONE_BODY = orjson.dumps({"journeys": [{"from_zone": 0, "to_zone": 2}]})
+EMPTY_JOURNEYS_BODY = orjson.dumps({"journeys": []})
+
+
+def journey_fares(journeys) -> np.ndarray:
+    """Collect the fares of serialized journeys into an array."""
+    return np.fromiter((journey["fare"] for journey in journeys), dtype=np.float64)
+
+
+def post_fares(client, body: bytes):
+    """Post an already-encoded JSON body to the fare calculation endpoint."""
+    return client.post("/api/calculate-fares", content=body, headers=JSON_HEADERS)
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    """One event loop for the whole session so the async client can be shared."""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+async def client():
+    """Async test client calling the app in-process over ASGI."""
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        yield ac
 
-# Initialize test database
-test_db_manager = DatabaseManager(f"sqlite:///{test_db.name}")
-test_db_manager.init_default_fare_rules()
 
-# Test client
-client = TestClient(app)
+# Model validation
+@pytest.mark.models
+def test_journey_validation_valid():
+    """Test valid journey creation."""
+    journey = Journey(from_zone=1, to_zone=2)
+    assert journey.from_zone == 1
+    assert journey.to_zone == 2
 
 
-class TestModels:
-    """Test model validation."""
+@pytest.mark.models
+def test_journey_validation_invalid_zone():
+    """Test invalid zone validation."""
+    # Zone 0 doesn't exist in database
+    with pytest.raises(ValueError):
+        Journey(from_zone=0, to_zone=2)
     
-    def test_journey_validation_valid(self):
-        """Test valid journey creation."""
-        journey = Journey(from_zone=1, to_zone=2)
-        assert journey.from_zone == 1
-        assert journey.to_zone == 2
+    # Zone 99 doesn't exist in database (assuming default setup)
+    with pytest.raises(ValueError):
+        Journey(from_zone=1, to_zone=99)
+
+
+@pytest.mark.models
+def test_journey_is_frozen_and_strict():
+    """Test journeys are immutable and reject unknown fields."""
+    journey = Journey(from_zone=1, to_zone=2)
+    with pytest.raises(ValidationError):
+        journey.to_zone = 3
     
-    def test_journey_validation_invalid_zone(self):
-        """Test invalid zone validation."""
-        # Zone 0 doesn't exist in database
-        with pytest.raises(ValueError):
-            Journey(from_zone=0, to_zone=2)
-        
-        # Zone 99 doesn't exist in database (assuming default setup)
-        with pytest.raises(ValueError):
-            Journey(from_zone=1, to_zone=99)
+    with pytest.raises(ValidationError):
+        Journey(from_zone=1, to_zone=2, fare=0.0)
+
+
+@pytest.mark.models
+def test_journey_request_max_journeys():
+    """Test maximum journeys validation."""
+    # Validate one journey and copy it rather than validating 21 times
+    journey = Journey(from_zone=1, to_zone=1)
+    journeys = [journey.model_copy() for _ in range(21)]
     
-    def test_journey_request_max_journeys(self):
-        """Test maximum journeys validation."""
-        journeys = [Journey(from_zone=1, to_zone=1) for _ in range(21)]
-        
-        with pytest.raises(ValueError):
-            JourneyRequest(journeys=journeys)
+    with pytest.raises(ValueError):
+        JourneyRequest(journeys=journeys)
+
+
+@pytest.mark.models
+def test_fare_rule_zone_key():
+    """Test fare rules precompute a normalized zone key and are immutable."""
+    rule = FareRule(from_zone=3, to_zone=1, fare=65.0)
+    assert rule.zone_key == (1, 3)
+    with pytest.raises(FrozenInstanceError):
+        rule.fare = 70.0
+
+
+# Fare calculation logic
+#
+# Journeys are built with model_construct: their zones are known to be
+# valid, and validation is covered by the model tests.
+@pytest.mark.calculator
+@pytest.mark.parametrize("from_zone, to_zone, expected", [
+    (1, 1, 40.0),
+    (2, 2, 35.0),
+    (3, 3, 30.0),
+])
+def test_single_fare_calculation_same_zone(calculator, from_zone, to_zone, expected):
+    """Test fare calculation within same zone."""
+    journey = Journey.model_construct(from_zone=from_zone, to_zone=to_zone)
+    assert calculator.calculate_single_fare(journey) == expected
+
+
+@pytest.mark.calculator
+@pytest.mark.parametrize("from_zone, to_zone, expected", [
+    (1, 2, 55.0),
+    (2, 1, 55.0),  # Reversed direction costs the same
+    (1, 3, 65.0),
+    (2, 3, 45.0),
+])
+def test_single_fare_calculation_different_zones(calculator, from_zone, to_zone, expected):
+    """Test fare calculation between different zones."""
+    journey = Journey.model_construct(from_zone=from_zone, to_zone=to_zone)
+    assert calculator.calculate_single_fare(journey) == expected
 
 
-class TestFareCalculator:
-    """Test fare calculation logic."""
+@pytest.mark.calculator
+def test_multiple_fares_calculation(calculator):
+    """Test calculation for multiple journeys."""
+    journeys = [
+        Journey.model_construct(from_zone=1, to_zone=2),  # 55
+        Journey.model_construct(from_zone=2, to_zone=3),  # 45
+        Journey.model_construct(from_zone=3, to_zone=3),  # 30
+        Journey.model_construct(from_zone=1, to_zone=1),  # 40
+    ]
     
-    def setup_method(self):
-        """Setup test fixtures."""
-        self.calculator = ZoneBasedFareCalculator()
+    response = calculator.calculate_all_fares(journeys)
     
-    def test_single_fare_calculation_same_zone(self):
-        """Test fare calculation within same zone."""
-        journey = Journey(from_zone=1, to_zone=1)
-        fare = self.calculator.calculate_single_fare(journey)
-        assert fare == 40.0
-        
-        journey = Journey(from_zone=2, to_zone=2)
-        fare = self.calculator.calculate_single_fare(journey)
-        assert fare == 35.0
-        
-        journey = Journey(from_zone=3, to_zone=3)
-        fare = self.calculator.calculate_single_fare(journey)
-        assert fare == 30.0
-    
-    def test_single_fare_calculation_different_zones(self):
-        """Test fare calculation between different zones."""
-        # Zone 1 to 2
-        journey = Journey(from_zone=1, to_zone=2)
-        fare = self.calculator.calculate_single_fare(journey)
-        assert fare == 55.0
-        
-        # Zone 2 to 1 (should be same as 1 to 2)
-        journey = Journey(from_zone=2, to_zone=1)
-        fare = self.calculator.calculate_single_fare(journey)
-        assert fare == 55.0
-        
-        # Zone 1 to 3
-        journey = Journey(from_zone=1, to_zone=3)
-        fare = self.calculator.calculate_single_fare(journey)
-        assert fare == 65.0
-        
-        # Zone 2 to 3
-        journey = Journey(from_zone=2, to_zone=3)
-        fare = self.calculator.calculate_single_fare(journey)
-        assert fare == 45.0
-    
-    def test_multiple_fares_calculation(self):
-        """Test calculation for multiple journeys."""
-        journeys = [
-            Journey(from_zone=1, to_zone=2),  # 55
-            Journey(from_zone=2, to_zone=3),  # 45
-            Journey(from_zone=3, to_zone=3),  # 30
-            Journey(from_zone=1, to_zone=1),  # 40
+    assert len(response["journeys"]) == 4
+    assert response["journey_count"] == 4
+    assert response["total_daily_fare"] == 170.0
+    
+    # Check individual fares in one comparison
+    np.testing.assert_array_equal(
+        journey_fares(response["journeys"]), [55.0, 45.0, 30.0, 40.0]
+    )
+
+
+@pytest.mark.calculator
+def test_calculate_all_fares_without_matrix(calculator, monkeypatch):
+    """Test journeys are priced one by one when the snapshot has no matrix."""
+    monkeypatch.setattr(cache_layer, "MAX_MATRIX_ZONES", 0)
+    matrixless = FareRulesSnapshot({(1, 2): 55.0})
+    monkeypatch.setattr(settings, "get_fare_rules_snapshot", lambda: matrixless)
+    
+    response = calculator.calculate_all_fares([
+        Journey.model_construct(from_zone=2, to_zone=1),
+        Journey.model_construct(from_zone=3, to_zone=3),
+    ])
+    np.testing.assert_array_equal(journey_fares(response["journeys"]), [55.0, 30.0])
+
+
+@pytest.mark.calculator
+def test_response_matches_fare_response_schema(calculator):
+    """Test that the raw dict response round-trips through FareResponse."""
+    journeys = [
+        Journey.model_construct(from_zone=1, to_zone=2),
+        Journey.model_construct(from_zone=3, to_zone=3),
+    ]
+    
+    response = calculator.calculate_all_fares(journeys)
+    
+    assert FareResponse.model_validate(response).model_dump() == response
+
+
+@pytest.mark.calculator
+@pytest.mark.parametrize("use_numba", [True, False])
+def test_gather_fares(monkeypatch, use_numba):
+    """Test the fare gather kernel with and without numba."""
+    if use_numba and not kernels.NUMBA_AVAILABLE:
+        pytest.skip("numba is not installed")
+    monkeypatch.setattr(kernels, "NUMBA_AVAILABLE", use_numba)
+    
+    fare_matrix = np.array([[0.0, 0.0, 0.0], [0.0, 40.0, 55.0], [0.0, 55.0, 35.0]])
+    from_zones = np.array([1, 2, 1], dtype=np.intp)
+    
+    fares = kernels.gather_fares(from_zones, np.array([2, 2, 1], dtype=np.intp), fare_matrix)
+    assert fares.tolist() == [55.0, 35.0, 40.0]
+    
+    # A zone outside the matrix means the caller must fall back
+    assert kernels.gather_fares(from_zones, np.array([2, 3, 1], dtype=np.intp), fare_matrix) is None
+
+
+@pytest.mark.calculator
+def test_calculators_implement_protocol():
+    """Test that all calculators implement the FareCalculatorInterface protocol."""
+    # Conformance itself is checked statically in fare_calculator.py; the
+    # protocol is not runtime checkable, so test the behaviour instead
+    calc: FareCalculatorInterface = ZoneBasedFareCalculator()
+    
+    # Test that methods work correctly
+    journey = Journey(from_zone=1, to_zone=2)
+    fare = calc.calculate_single_fare(journey)
+    assert isinstance(fare, float)
+    
+    response = calc.calculate_all_fares([journey])
+    assert FareResponse.model_validate(response).journey_count == 1
+
+
+# API endpoints
+@pytest.mark.api
+async def test_root_endpoint(client):
+    """Test root endpoint."""
+    response = await client.get("/")
+    assert response.status_code == 200
+    data = response.json()
+    assert "message" in data
+    assert data["version"] == settings.API_VERSION
+
+
+@pytest.mark.api
+async def test_health_check(client):
+    """Test health check endpoint."""
+    response = await client.get("/api/health")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "healthy"
+
+
+@pytest.mark.api
+async def test_fare_rules_endpoint(client):
+    """Test fare rules endpoint."""
+    response = await client.get("/api/fare-rules")
+    assert response.status_code == 200
+    # Don't assume specific zones - the model checks the structure
+    data = FareRulesResponse.model_validate_json(response.content)
+    assert data.max_journeys_per_day == 20
+    assert data.total_zones == len(data.available_zones)
+
+
+@pytest.mark.api
+@pytest.mark.parametrize("body, status_code", [
+    ({"zone_number": settings.MAX_ZONE_NUMBER + 1, "fares_to_existing_zones": {}}, 422),
+    ({"zone_number": 4, "fares_to_existing_zones": {4: 30.0, 5000: 90.0}}, 400),
+], ids=["zone_number_too_high", "unknown_fare_zone"])
+async def test_add_zone_rejects_out_of_range_zones(client, body, status_code):
+    """Test zones can't be added beyond the limit or via stray fare keys."""
+    response = await client.post("/api/zones", json=body)
+    assert response.status_code == status_code
+    assert not settings.is_valid_zone(4)
+
+
+@pytest.mark.api
+@pytest.mark.parametrize("zone_pairs, expected_fares", [
+    ([(1, 2)], [55.0]),
+    ([(1, 1), (1, 2), (2, 3), (3, 3)], [40.0, 55.0, 45.0, 30.0]),
+], ids=["single_journey", "multiple_journeys"])
+async def test_calculate_fares(client, zone_pairs, expected_fares):
+    """Test fare calculation for one or several journeys."""
+    body = orjson.dumps({
+        "journeys": [
+            {"from_zone": from_zone, "to_zone": to_zone}
+            for from_zone, to_zone in zone_pairs
         ]
-        
-        response = self.calculator.calculate_all_fares(journeys)
-        
-        assert len(response.journeys) == 4
-        assert response.journey_count == 4
-        assert response.total_daily_fare == 170.0
-        
-        # Check individual fares
-        assert response.journeys[0].fare == 55.0
-        assert response.journeys[1].fare == 45.0
-        assert response.journeys[2].fare == 30.0
-        assert response.journeys[3].fare == 40.0
+    })
     
+    response = await post_fares(client, body)
+    assert response.status_code == 200
     
-    def test_calculators_implement_protocol(self):
-        """Test that all calculators implement the FareCalculatorInterface protocol."""
-        calc = ZoneBasedFareCalculator()
-        
-        # Verify calculator implements the protocol
-        assert isinstance(calc, FareCalculatorInterface), \
-            f"{calc.__class__.__name__} does not implement FareCalculatorInterface"
-        
-        # Verify required methods exist
-        assert hasattr(calc, 'calculate_single_fare')
-        assert hasattr(calc, 'calculate_all_fares')
-        
-        # Test that methods work correctly
-        journey = Journey(from_zone=1, to_zone=2)
-        fare = calc.calculate_single_fare(journey)
-        assert isinstance(fare, float)
-        
-        response = calc.calculate_all_fares([journey])
-        assert isinstance(response, FareResponse)
-
-
-class TestAPI:
-    """Test API endpoints."""
-    
-    def test_root_endpoint(self):
-        """Test root endpoint."""
-        response = client.get("/")
-        assert response.status_code == 200
-        data = response.json()
-        assert "message" in data
-        assert data["version"] == settings.API_VERSION
-    
-    def test_health_check(self):
-        """Test health check endpoint."""
-        response = client.get("/api/health")
-        assert response.status_code == 200
-        data = response.json()
-        assert data["status"] == "healthy"
-    
-    def test_fare_rules_endpoint(self):
-        """Test fare rules endpoint."""
-        response = client.get("/api/fare-rules")
-        assert response.status_code == 200
-        data = response.json()
-        assert "rules" in data
-        assert "max_journeys_per_day" in data
-        assert "available_zones" in data
-        assert "datastore" in data
-        assert data["max_journeys_per_day"] == 20
-        # Don't assume specific zones - just check structure
-        assert isinstance(data["available_zones"], list)
-    
-    def test_calculate_fares_single_journey(self):
-        """Test fare calculation for single journey."""
-        payload = {
-            "journeys": [
-                {"from_zone": 1, "to_zone": 2}
-            ]
-        }
-        
-        response = client.post("/api/calculate-fares", json=payload)
-        assert response.status_code == 200
-        
-        data = response.json()
-        assert len(data["journeys"]) == 1
-        assert data["journeys"][0]["fare"] == 55.0
-        assert data["total_daily_fare"] == 55.0
-        assert data["journey_count"] == 1
-    
-    def test_calculate_fares_multiple_journeys(self):
-        """Test fare calculation for multiple journeys."""
-        payload = {
-            "journeys": [
-                {"from_zone": 1, "to_zone": 1},
-                {"from_zone": 1, "to_zone": 2},
-                {"from_zone": 2, "to_zone": 3},
-                {"from_zone": 3, "to_zone": 3}
-            ]
-        }
-        
-        response = client.post("/api/calculate-fares", json=payload)
-        assert response.status_code == 200
-        
-        data = response.json()
-        assert len(data["journeys"]) == 4
-        assert data["total_daily_fare"] == 170.0
-        assert data["journey_count"] == 4
-    
-    def test_calculate_fares_max_journeys(self):
-        """Test maximum journeys limit."""
-        payload = {
-            "journeys": [
-                {"from_zone": 1, "to_zone": 1} for _ in range(20)
-            ]
-        }
-        
-        response = client.post("/api/calculate-fares", json=payload)
-        assert response.status_code == 200
-        
-        data = response.json()
-        assert len(data["journeys"]) == 20
-        assert data["total_daily_fare"] == 800.0  # 20 * 40
-    
-    def test_calculate_fares_exceeds_max_journeys(self):
-        """Test exceeding maximum journeys limit."""
-        payload = {
-            "journeys": [
-                {"from_zone": 1, "to_zone": 1} for _ in range(21)
-            ]
-        }
-        
-        response = client.post("/api/calculate-fares", json=payload)
-        assert response.status_code == 422  # Validation error
-    
-    def test_calculate_fares_invalid_zone(self):
-        """Test invalid zone in request."""
-        payload = {
-            "journeys": [
-                {"from_zone": 0, "to_zone": 2}
-            ]
-        }
-        
-        response = client.post("/api/calculate-fares", json=payload)
-        assert response.status_code == 422  # Validation error
-    
-    def test_calculate_fares_empty_journeys(self):
-        """Test empty journeys list."""
-        payload = {
-            "journeys": []
-        }
-        
-        response = client.post("/api/calculate-fares", json=payload)
-        assert response.status_code == 422  # Validation error
+    data = response.json()
+    np.testing.assert_array_equal(journey_fares(data["journeys"]), expected_fares)
+    assert data["total_daily_fare"] == sum(expected_fares)
+    assert data["journey_count"] == len(zone_pairs)
 
 
-class TestConfiguration:
-    """Test configuration settings."""
+@pytest.mark.api
+async def test_calculate_fares_max_journeys(client):
+    """Test maximum journeys limit."""
+    response = await post_fares(client, MAX_JOURNEYS_BODY)
+    assert response.status_code == 200
     
-    def test_fare_rules_completeness(self):
-        """Test that all zone combinations have fare rules."""
-        zones = settings.get_available_zones()  # Get zones from database
-        
-        for from_zone in zones:
-            for to_zone in zones:
-                fare = settings.get_fare(from_zone, to_zone)
-                assert fare > 0, f"No fare rule for zones {from_zone} to {to_zone}"
-    
-    def test_zone_validation(self):
-        """Test zone validation."""
-        zones = settings.get_available_zones()
-        
-        if zones:  # Only test if zones exist in database
-            # Test existing zones are valid
-            for zone in zones:
-                assert settings.is_valid_zone(zone) == True
-            
-            # Test invalid zone (one that doesn't exist)
-            max_zone = max(zones)
-            assert settings.is_valid_zone(max_zone + 100) == False
-            assert settings.is_valid_zone(0) == False
-        else:
-            # If no zones in database, all should be invalid
-            assert settings.is_valid_zone(1) == False
-            assert settings.is_valid_zone(2) == False
-    
-    def test_dynamic_zones(self):
-        """Test that zones are loaded from database."""
-        zones = settings.get_available_zones()
-        assert isinstance(zones, list)
-        # Don't assume specific zone count - just check it's a list
-        
-        # If database was initialized, check expected zones exist
-        if zones:
-            assert all(isinstance(z, int) for z in zones)
-    
-    def test_min_max_zones(self):
-        """Test min and max zone methods."""
-        zones = settings.get_available_zones()
-        if zones:
-            min_zone = settings.get_min_zone()
-            max_zone = settings.get_max_zone()
-            assert min_zone == min(zones)
-            assert max_zone == max(zones)
-        else:
-            # If no zones, these should handle gracefully
-            pass  # No specific assertion for empty database
-
-
-class TestDatabase:
-    """Test database functionality."""
-    
-    def test_database_initialization(self):
-        """Test that database is initialized with default fare rules."""
-        from app.database import get_db_manager
-        
-        db_manager = get_db_manager()
-        rules = db_manager.get_all_fare_rules()
-        
-        # Should have 6 default rules
-        assert len(rules) == 6
-        
-        # Check specific rules
-        assert rules.get((1, 1)) == 40.0
-        assert rules.get((1, 2)) == 55.0
-        assert rules.get((2, 3)) == 45.0
-    
-    def test_get_fare_from_database(self):
-        """Test retrieving fare from database."""
-        from app.database import get_db_manager
-        
-        db_manager = get_db_manager()
-        
-        # Test exact match
-        fare = db_manager.get_fare(1, 2)
-        assert fare == 55.0
-        
-        # Test reversed zones (should work both ways)
-        fare = db_manager.get_fare(2, 1)
-        assert fare == 55.0
-        
-        # Test non-existent route
-        fare = db_manager.get_fare(1, 5)
-        assert fare is None
+    data = response.json()
+    np.testing.assert_array_equal(journey_fares(data["journeys"]), np.full(20, 40.0))
+    assert data["total_daily_fare"] == 800.0  # 20 * 40
+
+
+@pytest.mark.api
+async def test_calculate_fares_exceeds_max_journeys(client):
+    """Test exceeding maximum journeys limit."""
+    response = await post_fares(client, TOO_MANY_JOURNEYS_BODY)
+    assert response.status_code == 422  # Validation error
+
+
+@pytest.mark.api
+async def test_calculate_fares_invalid_zone(client):
+    """Test invalid zone in request."""
+    response = await post_fares(client, INVALID_ZONE_BODY)
+    assert response.status_code == 422  # Validation error
+
+
+@pytest.mark.api
+async def test_calculate_fares_documents_request_schema(client):
+    """Test the OpenAPI request body references the JourneyRequest schema."""
+    response = await client.get("/openapi.json")
+    operation = response.json()["paths"]["/api/calculate-fares"]["post"]
+    schema = operation["requestBody"]["content"]["application/json"]["schema"]
+    assert schema == {"$ref": "#/components/schemas/JourneyRequest"}
+
+
+@pytest.mark.api
+@pytest.mark.parametrize("journey, bad_fields", [
+    ({"from_zone": 1, "to_zone": 99}, ["to_zone"]),
+    ({"from_zone": 98, "to_zone": 99}, ["from_zone", "to_zone"]),
+])
+async def test_calculate_fares_invalid_zone_location(client, journey, bad_fields):
+    """Test each invalid zone is reported against its own field."""
+    response = await post_fares(client, orjson.dumps({"journeys": [journey]}))
+    assert response.status_code == 422
     
-    def test_update_fare_rule(self):
-        """Test updating fare rules in database."""
-        from app.database import get_db_manager
-        
-        db_manager = get_db_manager()
-        
-        # Update existing rule
-        original_fare = db_manager.get_fare(1, 1)
-        new_fare = 45.0
-        
-        db_manager.update_fare_rule(1, 1, new_fare)
-        updated_fare = db_manager.get_fare(1, 1)
-        
-        assert updated_fare == new_fare
-        
-        # Restore original
-        db_manager.update_fare_rule(1, 1, original_fare)
+    detail = response.json()["detail"]
+    assert [error["loc"] for error in detail] == [
+        ["body", "journeys", 0, field] for field in bad_fields
+    ]
+    assert [error["input"] for error in detail] == [journey[field] for field in bad_fields]
+
+
+@pytest.mark.api
+async def test_calculate_fares_empty_journeys(client):
+    """Test empty journeys list."""
+    response = await post_fares(client, EMPTY_JOURNEYS_BODY)
+    assert response.status_code == 422  # Validation error
+
+
+@pytest.mark.api
+async def test_updated_fare_rule_is_priced(client, restore_fare_rules):
+    """Test a fare rule update is used by the next fare calculation."""
+    response = await client.put(
+        "/api/fare-rules", json={"from_zone": 2, "to_zone": 1, "fare": 58.5}
+    )
+    assert response.status_code == 200
     
-    def test_config_values(self):
-        """Test system configuration storage."""
-        from app.database import get_db_manager
-        
-        db_manager = get_db_manager()
-        
-        max_journeys = db_manager.get_config_value("max_journeys_per_day")
-        assert max_journeys == "20"
-        
-        # Test non-existent config
-        non_existent = db_manager.get_config_value("non_existent_key")
-        assert non_existent is None
+    response = await post_fares(client, orjson.dumps({"journeys": [{"from_zone": 1, "to_zone": 2}]}))
+    assert response.status_code == 200
+    assert response.json()["total_daily_fare"] == 58.5
+
+
+@pytest.mark.api
+async def test_added_zone_is_priced(client, restore_fare_rules):
+    """Test a newly added zone can be priced straight away."""
+    response = await client.post("/api/zones", json={
+        "zone_number": 4,
+        "fares_to_existing_zones": {"1": 80.0, "2": 70.0, "3": 60.0, "4": 30.0}
+    })
+    assert response.status_code == 200
+    
+    journeys = [{"from_zone": 4, "to_zone": 1}, {"from_zone": 4, "to_zone": 4}]
+    response = await post_fares(client, orjson.dumps({"journeys": journeys}))
+    assert response.status_code == 200
+    np.testing.assert_array_equal(journey_fares(response.json()["journeys"]), [80.0, 30.0])
+
+
+# Configuration settings
+@pytest.mark.configuration
+def test_fare_rules_completeness(rules):
+    """Test that all zone combinations have fare rules."""
+    zones = settings.get_available_zones()  # Get zones from database
+    
+    missing = [
+        (a, b) for a, b in itertools.product(zones, zones)
+        if not (rules.get((a, b)) or rules.get((b, a)))
+    ]
+    assert not missing, f"No fare rule for zone pairs {missing}"
+
+
+@pytest.mark.configuration
+def test_zone_validation():
+    """Test zone validation."""
+    zones = settings.get_available_zones()
+    
+    if zones:  # Only test if zones exist in database
+        # Test existing zones are valid
+        for zone in zones:
+            assert settings.is_valid_zone(zone) == True
+        
+        # Test invalid zone (one that doesn't exist)
+        max_zone = max(zones)
+        assert settings.is_valid_zone(max_zone + 100) == False
+        assert settings.is_valid_zone(0) == False
+    else:
+        # If no zones in database, all should be invalid
+        assert settings.is_valid_zone(1) == False
+        assert settings.is_valid_zone(2) == False
+
+
+@pytest.mark.configuration
+def test_dynamic_zones():
+    """Test that zones are loaded from database."""
+    zones = settings.get_available_zones()
+    assert isinstance(zones, list)
+    # Don't assume specific zone count - just check it's a list
+    
+    # If database was initialized, check expected zones exist
+    if zones:
+        assert all(isinstance(z, int) for z in zones)
+
+
+@pytest.mark.configuration
+def test_min_max_zones():
+    """Test min and max zone methods."""
+    zones = settings.get_available_zones()
+    if zones:
+        min_zone = settings.get_min_zone()
+        max_zone = settings.get_max_zone()
+        assert min_zone == min(zones)
+        assert max_zone == max(zones)
+    else:
+        # If no zones, these should handle gracefully
+        pass  # No specific assertion for empty database
+
+
+@pytest.mark.configuration
+def test_zone_accessors_are_memoized():
+    """Test zones are loaded once until the zone caches are cleared."""
+    settings.clear_zone_caches()
+    zones = settings.get_available_zones()
+    assert settings.get_available_zones() is zones
+    
+    settings.clear_zone_caches()
+    assert settings.get_available_zones() is not zones
+    assert settings.get_available_zones() == zones
+
+
+@pytest.mark.configuration
+def test_zone_load_failure_is_not_cached(monkeypatch):
+    """Test a database error while loading zones is retried, not memoized."""
+    def unavailable():
+        raise RuntimeError("database unavailable")
+    
+    with monkeypatch.context() as patch:
+        patch.setattr(config, "get_db_manager", unavailable)
+        assert settings.refresh_valid_zones() == frozenset()
+        assert settings.get_available_zones() == []
+    
+    # The database is back: the next lookups recover on their own
+    assert settings.is_valid_zone(1)
+    assert settings.get_available_zones() == [1, 2, 3]
+
+
+# In-memory fare cache
+@pytest.mark.cache
+def test_memory_cache_is_bounded():
+    """Test the LRU evicts the least recently used pair when full."""
+    cache = FareRulesCache(max_entries=2)
+    cache.set_fare_cache(1, 1, 40.0)
+    cache.set_fare_cache(1, 2, 55.0)
+    assert cache.get_fare_cached(1, 1) == 40.0  # (1, 2) is now oldest
+    cache.set_fare_cache(2, 2, 35.0)
+    
+    assert cache.get_fare_cached(1, 2) is None
+    assert cache.get_fare_cached(2, 1) is None
+    assert cache.get_fare_cached(1, 1) == 40.0
+    assert cache.get_fare_cached(2, 2) == 35.0
+
+
+@pytest.mark.cache
+def test_memory_cache_misses_are_not_cached():
+    """Test a miss does not hide a later store of the same pair."""
+    cache = FareRulesCache()
+    assert cache.get_fare_cached(1, 3) is None
+    cache.set_fare_cache(3, 1, 65.0)
+    assert cache.get_fare_cached(1, 3) == 65.0
+
+
+@pytest.mark.cache
+def test_snapshot_fare_rows():
+    """Test fares are indexed by zone position in both directions."""
+    snapshot = FareRulesSnapshot({(1, 1): 40.0, (1, 3): 65.0, (3, 3): 30.0})
+    assert snapshot.zone_index == {1: 0, 3: 1}
+    assert snapshot.fare_rows == [[40.0, 65.0], [65.0, 30.0]]
+    assert snapshot.rules[(1, 3)] == 65.0
+    assert snapshot.zones == (1, 3)
+
+
+@pytest.mark.cache
+def test_snapshot_fare_matrix():
+    """Test the dense fare matrix is symmetric and zero-filled."""
+    snapshot = FareRulesSnapshot({(1, 1): 40.0, (3, 1): 65.0})
+    matrix = snapshot.fare_matrix
+    assert matrix.shape == (2, 2)
+    assert matrix[0, 1] == matrix[1, 0] == 65.0
+    assert matrix[0, 0] == 40.0
+    assert matrix[1, 1] == 0.0
+    assert not matrix.flags.writeable
+
+
+@pytest.mark.cache
+def test_snapshot_matrix_sized_by_zone_count():
+    """Test a large zone number doesn't grow the fare matrix."""
+    snapshot = FareRulesSnapshot({(1, 1): 40.0, (1, 6000): 90.0})
+    assert snapshot.fare_matrix.shape == (2, 2)
+    assert snapshot.fare_rows[snapshot.zone_index[6000]][snapshot.zone_index[1]] == 90.0
+
+
+@pytest.mark.cache
+def test_snapshot_skips_matrix_above_zone_cap(monkeypatch):
+    """Test too many zones skip the dense matrix and use the rules dict."""
+    monkeypatch.setattr(cache_layer, "MAX_MATRIX_ZONES", 2)
+    snapshot = FareRulesSnapshot({(1, 1): 40.0, (1, 2): 55.0, (2, 3): 45.0})
+    assert snapshot.fare_matrix is None
+    assert snapshot.fare_rows is None
+    
+    monkeypatch.setattr(cache_layer, "_snapshot", snapshot)
+    assert cache_layer.get_fare_with_cache(3, 2) == 45.0
+    assert cache_layer.get_fare_with_cache(1, 3) == 0.0
+
+
+@pytest.mark.cache
+def test_zones_cache_rules_hash():
+    """Test the rules fingerprint only changes when the rules do."""
+    cache = ZonesCache()
+    cache.set_zones([1, 2], {(1, 1): 40.0, (1, 2): 55.0})
+    original_hash = cache._rules_hash
+    
+    cache.set_zones([1, 2], {(1, 2): 55.0, (1, 1): 40.0})
+    assert cache._rules_hash == original_hash
+    
+    cache.set_zones([1, 2], {(1, 1): 40.0, (1, 2): 60.0})
+    assert cache._rules_hash != original_hash
+
+
+@pytest.mark.cache
+def test_snapshot_reload_clears_fare_lookups():
+    """Test memoized fare lookups are dropped when the rules reload."""
+    ZoneBasedFareCalculator().calculate_single_fare(Journey(from_zone=2, to_zone=1))
+    assert _cached_fare.cache_info().currsize > 0
+    
+    reload_fare_snapshot()
+    assert _cached_fare.cache_info().currsize == 0
+
+
+@pytest.mark.cache
+def test_snapshot_reload_clears_zone_set(db_manager):
+    """Test a snapshot reload drops the database manager's zone set."""
+    # Stand in for a zone set that another process's write made stale
+    db_manager._zone_set = frozenset()
+    assert not db_manager.is_valid_zone(1)
+    
+    reload_fare_snapshot()
+    assert db_manager.is_valid_zone(1)
+
+
+@pytest.mark.cache
+def test_snapshot_reload_clears_fare_cache(db_manager):
+    """Test a snapshot reload drops the database manager's cached fares."""
+    # Stand in for fares that another process's write made stale
+    db_manager._fare_cache = {(1, 2): 99.0}
+    assert db_manager.get_fare(1, 2) == 99.0
+    
+    reload_fare_snapshot()
+    assert db_manager.get_fare(1, 2) == 55.0
+
+
+@pytest.mark.cache
+def test_invalidation_listener_reloads_snapshot(monkeypatch):
+    """Test a published invalidation makes the listener reload the snapshot."""
+    reloaded = threading.Event()
+    monkeypatch.setattr(cache_layer, "reload_fare_snapshot", reloaded.set)
+    
+    redis_client = fakeredis.FakeRedis()
+    threading.Thread(
+        target=cache_layer._listen_for_invalidations,
+        args=(redis_client,),
+        daemon=True
+    ).start()
+    
+    # Publish once the listener has subscribed
+    for _ in range(100):
+        if redis_client.publish(cache_layer.INVALIDATION_CHANNEL, "1"):
+            break
+        reloaded.wait(0.01)
+    assert reloaded.wait(1)
+
+
+# Database functionality
+@pytest.mark.database
+def test_database_initialization(rules):
+    """Test that database is initialized with default fare rules."""
+    # Should have 6 default rules
+    assert len(rules) == 6
+    
+    # Check specific rules
+    assert rules.get((1, 1)) == 40.0
+    assert rules.get((1, 2)) == 55.0
+    assert rules.get((2, 3)) == 45.0
+
+
+@pytest.mark.database
+def test_get_rules_and_zones(db_manager, rules):
+    """Test rules and zones are loaded together in one query."""
+    loaded_rules, zones = db_manager.get_rules_and_zones()
+    
+    assert loaded_rules == rules
+    assert zones == sorted({zone for pair in rules for zone in pair})
+
+
+@pytest.mark.database
+def test_get_fare_from_database(db_manager):
+    """Test retrieving fare from database."""
+    # Test exact match
+    fare = db_manager.get_fare(1, 2)
+    assert fare == 55.0
+    
+    # Test reversed zones (should work both ways)
+    fare = db_manager.get_fare(2, 1)
+    assert fare == 55.0
+    
+    # Test non-existent route
+    fare = db_manager.get_fare(1, 5)
+    assert fare is None
+
+
+@pytest.mark.database
+def test_get_fare_uses_memory_cache(db_manager):
+    """Test repeated fare lookups are answered without SQL."""
+    db_manager.get_fare(1, 1)
+    statements = []
+    
+    def count(*args):
+        statements.append(args)
+    
+    event.listen(db_manager.engine, "before_cursor_execute", count)
+    try:
+        assert db_manager.get_fare(3, 1) == 65.0
+        assert db_manager.get_fare(2, 2) == 35.0
+    finally:
+        event.remove(db_manager.engine, "before_cursor_execute", count)
+    
+    assert statements == []
+
+
+@pytest.mark.database
+def test_update_fare_rule(db_manager, db_session):
+    """Test updating fare rules in database (rolled back afterwards)."""
+    new_fare = 45.0
+    
+    db_manager.update_fare_rule(1, 1, new_fare, session=db_session)
+    updated_fare = db_manager.get_fare(1, 1, session=db_session)
+    
+    assert updated_fare == new_fare
+
+
+@pytest.mark.database
+@pytest.mark.parametrize("in_memory, journal_mode", [
+    (False, "wal"),
+    (True, "memory"),
+], ids=["file", "in_memory"])
+def test_sqlite_pragmas(tmp_path, in_memory, journal_mode):
+    """
+    Test file databases get WAL journaling and in-memory ones skip it.
+    
+    Only in-memory (test) databases take transaction control away from
+    pysqlite for savepoint rollbacks.
+    """
+    url = "sqlite://" if in_memory else f"sqlite:///{tmp_path / 'pragmas.db'}"
+    manager = DatabaseManager(url, create_tables=False, poolclass=StaticPool)
+    try:
+        with manager.engine.connect() as connection:
+            pragma = connection.exec_driver_sql
+            assert pragma("PRAGMA journal_mode").scalar() == journal_mode
+            assert pragma("PRAGMA temp_store").scalar() == 2  # MEMORY
+            driver_connection = connection.connection.driver_connection
+            assert (driver_connection.isolation_level is None) == in_memory
+    finally:
+        manager.engine.dispose()
+
+
+@pytest.mark.database
+def test_reversed_rules_are_normalized(db_manager, db_session):
+    """Test rules stored in (high, low) order are folded into (low, high)."""
+    db_session.add_all([
+        FareRuleDB(from_zone=4, to_zone=1, fare=75.0),  # No (1, 4) rule yet
+        FareRuleDB(from_zone=3, to_zone=1, fare=99.0),  # Duplicates (1, 3)
+    ])
+    db_session.commit()
+    
+    db_manager.init_default_fare_rules(session=db_session)
+    
+    rules = db_manager.get_all_fare_rules(session=db_session)
+    assert rules[(1, 4)] == 75.0
+    assert rules[(1, 3)] == 65.0
+    assert all(a <= b for a, b in rules)
+    
+    # Updates now find the existing row instead of adding a second one
+    db_manager.update_fare_rule(4, 1, 80.0, session=db_session)
+    assert db_manager.get_fare(1, 4, session=db_session) == 80.0
+    assert len(db_manager.get_all_fare_rules(session=db_session)) == len(rules)
+
+
+@pytest.mark.database
+def test_config_values(db_manager):
+    """Test system configuration storage."""
+    
+    max_journeys = db_manager.get_config_value("max_journeys_per_day")
+    assert max_journeys == "20"
+    
+    # Test non-existent config
+    non_existent = db_manager.get_config_value("non_existent_key")
+    assert non_existent is None
 
 
 if __name__ == "__main__":
@@ -7,6 +7,16 @@ This script demonstrates how to add new zones without any code changes.
 import requests
 import json
 import sys
+from requests.adapters import HTTPAdapter
+
+
+# Suggested fares by zone distance (same zone, adjacent, two apart, three apart)
+_FARE_BY_DISTANCE = (25.0, 45.0, 60.0, 75.0)
+
+# Shared session so the API calls reuse one keep-alive connection
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=4))
+_SESSION.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=4))
 
 
 def add_zone_via_api(base_url: str = "http://localhost:8000", 
@@ -25,7 +35,7 @@ def add_zone_via_api(base_url: str = "http://localhost:8000",
         return
     
     # First, get current zones
-    response = requests.get(f"{base_url}/api/fare-rules")
+    response = _SESSION.get(f"{base_url}/api/fare-rules")
     data = response.json()
     
     print(f"Current zones: {data['available_zones']}")
@@ -38,7 +48,7 @@ def add_zone_via_api(base_url: str = "http://localhost:8000",
     }
     
     print(f"\nAdding Zone {zone_number}...")
-    response = requests.post(
+    response = _SESSION.post(
         f"{base_url}/api/zones",
         json=new_zone_data
     )
@@ -50,7 +60,7 @@ def add_zone_via_api(base_url: str = "http://localhost:8000",
         print(f"✗ Failed to add zone: {response.text}")
     
     # Verify the new zone was added
-    response = requests.get(f"{base_url}/api/fare-rules")
+    response = _SESSION.get(f"{base_url}/api/fare-rules")
     data = response.json()
     print(f"\nUpdated zones: {data['available_zones']}")
 
@@ -124,17 +134,10 @@ def calculate_fare_by_distance(zone_a: int, zone_b: int) -> float:
     """
     distance = abs(zone_a - zone_b)
     
-    # Simple fare model based on distance
-    if distance == 0:
-        return 25.0  # Same zone
-    elif distance == 1:
-        return 45.0  # Adjacent zones
-    elif distance == 2:
-        return 60.0  # Two zones apart
-    elif distance == 3:
-        return 75.0  # Three zones apart
-    else:
-        return 75.0 + (distance - 3) * 10.0  # Far zones
+    # Simple fare model based on distance; zones beyond the table add 10.0 each
+    if distance < len(_FARE_BY_DISTANCE):
+        return _FARE_BY_DISTANCE[distance]
+    return _FARE_BY_DISTANCE[-1] + (distance - (len(_FARE_BY_DISTANCE) - 1)) * 10.0
 
 
 def add_zone_automatically():
@@ -161,10 +164,10 @@ def add_zone_automatically():
     print(f"Adding Zone {next_zone} automatically...")
     
     # Calculate fares based on distance
-    fares = {}
-    for existing_zone in current_zones:
-        fares[existing_zone] = calculate_fare_by_distance(next_zone, existing_zone)
-    fares[next_zone] = calculate_fare_by_distance(next_zone, next_zone)
+    fares = {
+        zone: calculate_fare_by_distance(next_zone, zone)
+        for zone in (*current_zones, next_zone)
+    }
     
     # Display calculated fares
     print(f"\nCalculated fares for Zone {next_zone}:")